@@ -0,0 +1,171 @@
+"""
+Timing, baselines and regression checks shared by the benchmark suites.
+"""
+
+import json
+import os
+from os import path
+import statistics
+import time
+from typing import Callable, Dict, List, Optional
+
+# A benchmark regresses if it is slower than its baseline by this share...
+TOLERANCE = 0.2
+# ...and by at least this many seconds, so tiny timings don't flap
+MIN_DIFFERENCE = 0.005
+
+
+class Suite:
+    """
+    Collects timings and output hashes of one benchmark run.
+
+    Usage:
+
+        suite = Suite("years=5")
+        suite.time("filter_data", lambda: filter_data(...), repeat=3)
+        suite.outputs["file.csv"] = sha256
+        suite.counts["GetObject requests"] = 42
+        suite.report(load_baseline(path).get(suite.name))
+    """
+
+    def __init__(self, name: str, info: Optional[dict] = None):
+        self.name = name
+        self.info = info or {}
+        self.timings: Dict[str, dict] = {}
+        self.outputs: Dict[str, str] = {}
+        # Deterministic amounts like requests, which must not grow
+        self.counts: Dict[str, int] = {}
+
+    def time(
+        self,
+        name: str,
+        fn: Callable,
+        *,
+        repeat: int = 3,
+        setup: Optional[Callable] = None,
+        count: Optional[int] = None,
+    ):
+        """
+        Runs ``fn`` ``repeat`` times, calling ``setup`` untimed before each
+        run. With ``count``, the throughput in items per second is reported.
+        Returns the result of the last run.
+        """
+        runs = []
+        result = None
+
+        for _ in range(repeat):
+            if setup is not None:
+                setup()
+
+            start = time.perf_counter()
+            result = fn()
+            runs.append(time.perf_counter() - start)
+
+        timing = {"min": min(runs), "median": statistics.median(runs)}
+        if count:
+            timing["per_second"] = count / timing["min"]
+
+        self.timings[name] = timing
+        print(f"  {name:<55} {_format(timing)}", flush=True)
+
+        return result
+
+    def as_dict(self) -> dict:
+        return {
+            "info": self.info,
+            "timings": self.timings,
+            "outputs": self.outputs,
+            "counts": self.counts,
+        }
+
+    def compare(self, baseline: Optional[dict]) -> List[str]:
+        """
+        Returns the problems found when comparing with a baseline: slower
+        timings, outputs that changed and counts that grew
+        """
+        if baseline is None:
+            return []
+
+        problems = []
+
+        for name, timing in self.timings.items():
+            old = baseline["timings"].get(name)
+            if old is None:
+                continue
+
+            difference = timing["min"] - old["min"]
+            if difference > old["min"] * TOLERANCE and difference > MIN_DIFFERENCE:
+                problems.append(
+                    f"{name} regressed: {old['min']:.4f} s -> {timing['min']:.4f} s "
+                    f"(+{difference / old['min']:.0%})"
+                )
+
+        # Outputs only have to match if they were computed from the same input
+        if baseline["info"] == self.info:
+            for filename, digest in sorted(self.outputs.items()):
+                old = baseline["outputs"].get(filename)
+                if old is not None and old != digest:
+                    problems.append(f"{filename} differs from baseline")
+
+            missing = set(baseline["outputs"]) - set(self.outputs)
+            problems.extend(f"{filename} is missing" for filename in sorted(missing))
+
+            for name, count in sorted(self.counts.items()):
+                old = baseline.get("counts", {}).get(name)
+                if old is not None and count > old:
+                    problems.append(f"{name} increased: {old:,} -> {count:,}")
+        elif self.outputs or self.counts:
+            print("  Input differs from baseline, outputs not compared")
+
+        return problems
+
+
+def load_baseline(file_path: str) -> dict:
+    try:
+        with open(file_path, "r", encoding="utf-8") as fp:
+            return json.load(fp)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(file_path: str, suites: List[Suite]):
+    baseline = load_baseline(file_path)
+    for suite in suites:
+        baseline[suite.name] = suite.as_dict()
+
+    os.makedirs(path.dirname(file_path) or ".", exist_ok=True)
+    with open(file_path, "w", encoding="utf-8") as fp:
+        json.dump(baseline, fp, indent=2, sort_keys=True)
+
+    print(f"Saved baseline to {file_path}")
+
+
+def check(suites: List[Suite], baseline: dict) -> bool:
+    """
+    Prints the problems of all suites compared to the baseline and returns
+    whether there were none
+    """
+    ok = True
+
+    for suite in suites:
+        if suite.name not in baseline:
+            print(f"{suite.name}: no baseline")
+            continue
+
+        problems = suite.compare(baseline[suite.name])
+        if problems:
+            ok = False
+            print(f"{suite.name}: {len(problems)} problems")
+            for problem in problems:
+                print(f"  {problem}")
+        else:
+            print(f"{suite.name}: OK")
+
+    return ok
+
+
+def _format(timing: dict) -> str:
+    text = f"min {timing['min']:9.4f} s   median {timing['median']:9.4f} s"
+    if "per_second" in timing:
+        text += f"   {timing['per_second']:,.0f}/s"
+    return text
@@ -0,0 +1,121 @@
+"""
+Measures the import time of the Lambda entry points.
+
+Run with
+python -m benchmarks.importtime [module ...]
+from the repository root. Each module is imported in a fresh interpreter with
+``-X importtime``, so the numbers include everything a cold start has to load.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple
+
+MODULES = ["handler", "insolvenzen.twentyone"]
+
+# Variables the modules read at import time
+ENVIRONMENT = {
+    "SENTRY_URI": "",
+    "AWS_DEFAULT_REGION": "eu-central-1",
+}
+
+
+class ImportTime(NamedTuple):
+    module: str
+    # Microseconds spent in the module itself and including its imports
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def measure(module: str, repeat: int = 1) -> List[ImportTime]:
+    """
+    Imports ``module`` in a new interpreter and returns the best time of each
+    imported module over ``repeat`` runs
+    """
+    env = dict(os.environ)
+    for key, value in ENVIRONMENT.items():
+        env.setdefault(key, value)
+
+    best: Dict[str, ImportTime] = {}
+
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+
+        for import_time in parse(result.stderr):
+            previous = best.get(import_time.module)
+            if previous is None or import_time.cumulative_us < previous.cumulative_us:
+                best[import_time.module] = import_time
+
+    return list(best.values())
+
+
+def parse(output: str) -> List[ImportTime]:
+    """
+    Parses the lines ``-X importtime`` writes to stderr
+    """
+    import_times = []
+
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+
+        import_times.append(
+            ImportTime(name.strip(), int(self_us), int(cumulative_us), depth)
+        )
+
+    return import_times
+
+
+def report(module: str, import_times: List[ImportTime], top: int):
+    total = next(
+        (t.cumulative_us for t in import_times if t.module == module),
+        sum(t.self_us for t in import_times),
+    )
+
+    print(f"{module}: {total / 1000:.1f} ms, {len(import_times)} modules")
+
+    # Top-level packages by the time spent in all of their modules
+    packages: Dict[str, int] = {}
+    for import_time in import_times:
+        package = import_time.module.split(".")[0]
+        packages[package] = packages.get(package, 0) + import_time.self_us
+
+    print(f"  {'package':<40} {'self ms':>10}")
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {package:<40} {self_us / 1000:>10.1f}")
+
+    print(f"  {'module':<40} {'self ms':>10} {'cumul. ms':>10}")
+    for import_time in sorted(import_times, key=lambda t: -t.self_us)[:top]:
+        print(
+            f"  {import_time.module:<40} {import_time.self_us / 1000:>10.1f} "
+            f"{import_time.cumulative_us / 1000:>10.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    for module in args.modules:
+        report(module, measure(module, args.repeat), args.top)
+        print()
+
+
+if __name__ == "__main__":
+    main()
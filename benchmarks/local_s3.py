@@ -0,0 +1,484 @@
+"""
+Filesystem-backed stand-in for S3, served over HTTP so the real boto3 code
+paths of the scrapers and the twentyone pipeline can run offline.
+
+Usage:
+
+    with LocalS3Server(root, buckets={"source": data_dir}, latency=0.02) as server:
+        os.environ["S3_ENDPOINT_URL"] = server.endpoint_url
+        s3.set_client(None)
+        ...
+        print(server.stats.table())
+
+Every bucket is a directory, either below ``root`` or mapped explicitly with
+``buckets``, so synthetic data can be served without copying. Objects are the
+files in it; content type and encoding of uploads are kept in sidecar files
+below ``root/.metadata``. Only the operations used by this repository are
+implemented: GetObject, HeadObject, PutObject, CopyObject and ListObjectsV2.
+
+Each request is delayed by ``latency`` seconds, plus its size divided by
+``bytes_per_second`` if set. Requests and bytes are counted per operation.
+"""
+
+from collections import defaultdict
+import datetime as dt
+from email.utils import formatdate
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+from os import path
+import shutil
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.sax.saxutils import escape
+
+METADATA_DIR = ".metadata"
+LIST_MAX_KEYS = 1000
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Headers of PutObject requests that are returned on GetObject
+STORED_HEADERS = ["Content-Type", "Content-Encoding"]
+
+
+class NoSuchKey(Exception):
+    pass
+
+
+class NoSuchBucket(Exception):
+    pass
+
+
+class Stats:
+    """
+    Requests and bytes per operation. ``bytes_in`` is what clients sent,
+    ``bytes_out`` what they received.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.operations = defaultdict(
+                lambda: {"requests": 0, "bytes_in": 0, "bytes_out": 0}
+            )
+
+    def add(self, operation: str, bytes_in: int, bytes_out: int):
+        with self.lock:
+            counts = self.operations[operation]
+            counts["requests"] += 1
+            counts["bytes_in"] += bytes_in
+            counts["bytes_out"] += bytes_out
+
+    def as_dict(self) -> Dict[str, dict]:
+        with self.lock:
+            return {
+                operation: dict(counts)
+                for operation, counts in sorted(self.operations.items())
+            }
+
+    def table(self) -> str:
+        lines = [
+            f"{'operation':<16} {'requests':>10} {'bytes in':>14} {'bytes out':>14}"
+        ]
+        for operation, counts in self.as_dict().items():
+            lines.append(
+                f"{operation:<16} {counts['requests']:>10,} "
+                f"{counts['bytes_in']:>14,} {counts['bytes_out']:>14,}"
+            )
+        return "\n".join(lines)
+
+
+class Storage:
+    def __init__(self, root: str, buckets: Optional[Dict[str, str]] = None):
+        self.root = root
+        self.buckets = dict(buckets or {})
+        # (path, size, mtime) -> ETag, so listings don't hash files every time
+        self.etags = {}
+        self.lock = threading.Lock()
+
+    def create_bucket(self, bucket: str):
+        os.makedirs(
+            self.buckets.get(bucket, path.join(self.root, bucket)), exist_ok=True
+        )
+
+    def bucket_dir(self, bucket: str) -> str:
+        directory = self.buckets.get(bucket, path.join(self.root, bucket))
+        if not path.isdir(directory):
+            raise NoSuchBucket(bucket)
+        return directory
+
+    def object_path(self, bucket: str, key: str) -> str:
+        file_path = path.join(self.bucket_dir(bucket), *key.split("/"))
+        if not path.isfile(file_path):
+            raise NoSuchKey(key)
+        return file_path
+
+    def metadata_path(self, bucket: str, key: str) -> str:
+        return path.join(self.root, METADATA_DIR, bucket, *key.split("/")) + ".json"
+
+    def etag(self, file_path: str) -> str:
+        stat = os.stat(file_path)
+        cache_key = (file_path, stat.st_size, stat.st_mtime_ns)
+
+        with self.lock:
+            etag = self.etags.get(cache_key)
+
+        if etag is None:
+            digest = hashlib.md5()
+            with open(file_path, "rb") as fp:
+                for chunk in iter(lambda: fp.read(1 << 20), b""):
+                    digest.update(chunk)
+            etag = f'"{digest.hexdigest()}"'
+
+            with self.lock:
+                self.etags[cache_key] = etag
+
+        return etag
+
+    def metadata(self, bucket: str, key: str) -> dict:
+        try:
+            with open(self.metadata_path(bucket, key), "r", encoding="utf-8") as fp:
+                return json.load(fp)
+        except FileNotFoundError:
+            return {}
+
+    def head(self, bucket: str, key: str) -> dict:
+        file_path = self.object_path(bucket, key)
+        stat = os.stat(file_path)
+        headers = {
+            "Content-Type": "binary/octet-stream",
+            "ETag": self.etag(file_path),
+            "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        }
+        headers.update(self.metadata(bucket, key))
+        return headers
+
+    def get(self, bucket: str, key: str) -> bytes:
+        with open(self.object_path(bucket, key), "rb") as fp:
+            return fp.read()
+
+    def put(self, bucket: str, key: str, body: bytes, metadata: dict) -> str:
+        file_path = path.join(self.bucket_dir(bucket), *key.split("/"))
+        os.makedirs(path.dirname(file_path), exist_ok=True)
+
+        # Write to a temporary file first, so readers never see partial objects
+        temp_path = f"{file_path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as fp:
+            fp.write(body)
+        os.replace(temp_path, file_path)
+
+        metadata_path = self.metadata_path(bucket, key)
+        if metadata:
+            os.makedirs(path.dirname(metadata_path), exist_ok=True)
+            with open(metadata_path, "w", encoding="utf-8") as fp:
+                json.dump(metadata, fp)
+        elif path.exists(metadata_path):
+            os.remove(metadata_path)
+
+        return f'"{hashlib.md5(body).hexdigest()}"'
+
+    def copy(self, source_bucket: str, source_key: str, bucket: str, key: str) -> str:
+        return self.put(
+            bucket,
+            key,
+            self.get(source_bucket, source_key),
+            self.metadata(source_bucket, source_key),
+        )
+
+    def list(self, bucket: str, prefix: str, start_after: str) -> list:
+        """
+        Returns ``(key, size, mtime, file path)`` of the objects below
+        ``prefix`` sorted by key
+        """
+        directory = self.bucket_dir(bucket)
+        objects = []
+
+        for dirpath, dirnames, filenames in os.walk(directory):
+            dirnames.sort()
+            for filename in filenames:
+                if filename.endswith(".tmp"):
+                    continue
+
+                file_path = path.join(dirpath, filename)
+                key = path.relpath(file_path, directory).replace(os.sep, "/")
+                if key.startswith(prefix) and key > start_after:
+                    stat = os.stat(file_path)
+                    objects.append((key, stat.st_size, stat.st_mtime, file_path))
+
+        return sorted(objects)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "LocalS3Server"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _target(self):
+        url = urlsplit(self.path)
+        bucket, _, key = url.path.lstrip("/").partition("/")
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        return unquote(bucket), unquote(key), query
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+
+        if "aws-chunked" in (self.headers.get("Content-Encoding") or ""):
+            body = _decode_aws_chunked(body)
+
+        return body
+
+    def _respond(
+        self,
+        operation: str,
+        status: int,
+        *,
+        body: bytes = b"",
+        headers: Optional[dict] = None,
+        bytes_in: int = 0,
+        send_body: bool = True,
+    ):
+        self.server.delay(bytes_in + len(body))
+        self.server.stats.add(operation, bytes_in, len(body) if send_body else 0)
+
+        headers = {"Content-Length": str(len(body)), **(headers or {})}
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        if send_body:
+            self.wfile.write(body)
+
+    def _error(self, operation: str, status: int, code: str, message: str, **kwargs):
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            f"<Error><Code>{code}</Code><Message>{escape(message)}</Message></Error>"
+        ).encode("utf-8")
+        self._respond(
+            operation,
+            status,
+            body=body,
+            headers={"Content-Type": "application/xml"},
+            **kwargs,
+        )
+
+    def _handle(self, operation: str, fn, **kwargs):
+        try:
+            fn()
+        except NoSuchKey as e:
+            self._error(operation, 404, "NoSuchKey", str(e), **kwargs)
+        except NoSuchBucket as e:
+            self._error(operation, 404, "NoSuchBucket", str(e), **kwargs)
+
+    def do_HEAD(self):
+        bucket, key, _ = self._target()
+
+        def head():
+            storage = self.server.storage
+            headers = storage.head(bucket, key)
+            headers["Content-Length"] = str(
+                path.getsize(storage.object_path(bucket, key))
+            )
+            self._respond("HeadObject", 200, headers=headers, send_body=False)
+
+        self._handle("HeadObject", head, send_body=False)
+
+    def do_GET(self):
+        bucket, key, query = self._target()
+
+        if not key:
+            self._handle("ListObjectsV2", lambda: self._list(bucket, query))
+            return
+
+        def get():
+            storage = self.server.storage
+            headers = storage.head(bucket, key)
+            file_path = storage.object_path(bucket, key)
+            size = path.getsize(file_path)
+
+            self.server.delay(size)
+            self.server.stats.add("GetObject", 0, size)
+
+            # Objects are streamed, so the stand-in doesn't add their size to
+            # the memory of the process it runs in
+            headers["Content-Length"] = str(size)
+            self.send_response(200)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+
+            with open(file_path, "rb") as fp:
+                shutil.copyfileobj(fp, self.wfile, STREAM_CHUNK_SIZE)
+
+        self._handle("GetObject", get)
+
+    def do_PUT(self):
+        bucket, key, _ = self._target()
+        body = self._body()
+        copy_source = self.headers.get("x-amz-copy-source")
+
+        if copy_source:
+
+            def copy():
+                source_bucket, _, source_key = (
+                    unquote(copy_source.split("?")[0]).lstrip("/").partition("/")
+                )
+                etag = self.server.storage.copy(source_bucket, source_key, bucket, key)
+                result = (
+                    '<?xml version="1.0" encoding="UTF-8"?>\n'
+                    f"<CopyObjectResult><LastModified>{_timestamp(time.time())}"
+                    f"</LastModified><ETag>{escape(etag)}</ETag></CopyObjectResult>"
+                ).encode("utf-8")
+                self._respond(
+                    "CopyObject",
+                    200,
+                    body=result,
+                    headers={"Content-Type": "application/xml"},
+                )
+
+            self._handle("CopyObject", copy)
+            return
+
+        def put():
+            metadata = {
+                name: self.headers[name]
+                for name in STORED_HEADERS
+                if self.headers.get(name)
+            }
+            # aws-chunked only describes the transfer, not the stored object
+            encoding = [
+                value.strip()
+                for value in metadata.get("Content-Encoding", "").split(",")
+                if value.strip() and value.strip() != "aws-chunked"
+            ]
+            if encoding:
+                metadata["Content-Encoding"] = ", ".join(encoding)
+            else:
+                metadata.pop("Content-Encoding", None)
+
+            etag = self.server.storage.put(bucket, key, body, metadata)
+            self._respond("PutObject", 200, headers={"ETag": etag}, bytes_in=len(body))
+
+        self._handle("PutObject", put, bytes_in=len(body))
+
+    def _list(self, bucket: str, query: dict):
+        prefix = query.get("prefix", "")
+        max_keys = min(int(query.get("max-keys", LIST_MAX_KEYS)), LIST_MAX_KEYS)
+        start_after = query.get("continuation-token") or query.get("start-after", "")
+
+        objects = self.server.storage.list(bucket, prefix, start_after)
+        page, truncated = objects[:max_keys], len(objects) > max_keys
+
+        contents = "".join(
+            f"<Contents><Key>{escape(key)}</Key>"
+            f"<LastModified>{_timestamp(mtime)}</LastModified>"
+            f"<ETag>{escape(self.server.storage.etag(file_path))}</ETag>"
+            f"<Size>{size}</Size><StorageClass>STANDARD</StorageClass></Contents>"
+            for key, size, mtime, file_path in page
+        )
+        token = (
+            f"<NextContinuationToken>{escape(page[-1][0])}</NextContinuationToken>"
+            if truncated
+            else ""
+        )
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+            f"<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix>"
+            f"<KeyCount>{len(page)}</KeyCount><MaxKeys>{max_keys}</MaxKeys>"
+            f"<IsTruncated>{str(truncated).lower()}</IsTruncated>{token}"
+            f"{contents}</ListBucketResult>"
+        ).encode("utf-8")
+
+        self._respond(
+            "ListObjectsV2",
+            200,
+            body=body,
+            headers={"Content-Type": "application/xml"},
+        )
+
+
+class LocalS3Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        root: str,
+        *,
+        buckets: Optional[Dict[str, str]] = None,
+        latency: float = 0.0,
+        bytes_per_second: Optional[float] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        super().__init__((host, port), Handler)
+        self.storage = Storage(root, buckets)
+        self.latency = latency
+        self.bytes_per_second = bytes_per_second
+        self.stats = Stats()
+        self.thread = None
+
+    @property
+    def endpoint_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def delay(self, size: int):
+        seconds = self.latency
+        if self.bytes_per_second:
+            seconds += size / self.bytes_per_second
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def _timestamp(seconds: float) -> str:
+    return (
+        dt.datetime.fromtimestamp(seconds, dt.timezone.utc).strftime(
+            "%Y-%m-%dT%H:%M:%S.%f"
+        )[:-3]
+        + "Z"
+    )
+
+
+def _decode_aws_chunked(body: bytes) -> bytes:
+    """
+    Decodes a body sent with ``Content-Encoding: aws-chunked``, dropping
+    chunk signatures and trailing checksums
+    """
+    data = []
+    position = 0
+
+    while True:
+        line_end = body.index(b"\r\n", position)
+        size = int(body[position:line_end].split(b";")[0], 16)
+        position = line_end + 2
+        if size == 0:
+            break
+        data.append(body[position : position + size])
+        position += size + 2
+
+    return b"".join(data)
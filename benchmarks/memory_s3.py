@@ -0,0 +1,61 @@
+"""
+In-memory stand-in for the parts of the S3 client used by utils.storage.
+"""
+
+from collections import Counter
+import gzip
+from io import BytesIO
+from threading import Lock
+
+from botocore.exceptions import ClientError
+
+
+class MemoryS3:
+    def __init__(self):
+        # (bucket, key) -> (body, metadata passed on upload)
+        self.objects = {}
+        self.requests = Counter()
+        self.lock = Lock()
+
+    def _get(self, bucket: str, key: str, operation: str):
+        with self.lock:
+            self.requests[operation] += 1
+            try:
+                return self.objects[(bucket, key)]
+            except KeyError:
+                raise ClientError(
+                    {"Error": {"Code": "NoSuchKey", "Message": key}}, operation
+                ) from None
+
+    def get_object(self, Bucket, Key, **kwargs):
+        body, metadata = self._get(Bucket, Key, "GetObject")
+        return {"Body": BytesIO(body), "ContentLength": len(body), **metadata}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        if not isinstance(Body, (bytes, bytearray)):
+            Body = Body.read()
+
+        with self.lock:
+            self.requests["PutObject"] += 1
+            self.objects[(Bucket, Key)] = (bytes(Body), kwargs)
+
+        return {}
+
+    def copy_object(self, CopySource, Bucket, Key, **kwargs):
+        body, metadata = self._get(
+            CopySource["Bucket"], CopySource["Key"], "CopyObject"
+        )
+
+        with self.lock:
+            self.objects[(Bucket, Key)] = (body, metadata)
+
+        return {}
+
+    def content(self, bucket: str, key: str) -> bytes:
+        """
+        Returns the content of an object as clients would receive it
+        """
+        body, metadata = self.objects[(bucket, key)]
+        if metadata.get("ContentEncoding") == "gzip":
+            body = gzip.decompress(body)
+        return body
@@ -0,0 +1,243 @@
+"""
+Benchmarks the S3 I/O of a full scrape and of the twentyone pipeline against
+a local S3 stand-in.
+
+Run with
+python -m benchmarks.s3_io [--years 2] [--latency 0.02] [--save-baseline]
+
+Unlike the other suites, nothing is read from local files: synthetic source
+data is served by :class:`benchmarks.local_s3.LocalS3Server` and the real
+boto3 client is pointed to it with ``S3_ENDPOINT_URL``. A scrape is run with
+empty caches and again with warm ones, and the twentyone files are extracted
+and uploaded to the extract bucket. Besides the timings, requests and bytes
+per operation are recorded, and the command fails if they grow compared to
+the baseline.
+"""
+
+import os
+
+# The S3 code paths only run without local files
+os.environ.pop("USE_LOCAL_FILES", None)
+for name, value in {
+    "AWS_ACCESS_KEY_ID": "benchmark",
+    "AWS_SECRET_ACCESS_KEY": "benchmark",
+    "AWS_DEFAULT_REGION": "eu-central-1",
+    "BUCKET_SOURCE_NAME": "benchmark-source",
+    "BUCKET_PUBLIC_NAME": "benchmark-public",
+    "BUCKET_EXTRACT_NAME": "benchmark-extract",
+    "BUCKET_SOURCE_NAME_TWENTYONE": "benchmark-twentyone",
+    "SENTRY_URI": "",
+}.items():
+    os.environ.setdefault(name, value)
+
+import argparse
+import datetime as dt
+import hashlib
+from os import path
+import shutil
+import sys
+import tempfile
+
+from loguru import logger
+
+from benchmarks import synthetic, twentyone_synthetic
+from benchmarks.harness import Suite, check, load_baseline, save_baseline
+from benchmarks.local_s3 import LocalS3Server
+import handler
+from insolvenzen.scrapers import dedup
+from insolvenzen.twentyone import handle_file
+from insolvenzen.twentyone.loader import JSONL_PATH
+from insolvenzen.utils import s3, source, storage
+
+BASELINE = path.join(path.dirname(__file__), "results", "s3_io.json")
+DATA_DIR = path.join(tempfile.gettempdir(), "insolvenzen-benchmark-s3")
+
+
+def prepare(directory: str, generate) -> str:
+    """
+    Runs ``generate`` into ``directory`` unless it completed before
+    """
+    marker = path.join(directory, "complete")
+
+    if not path.exists(marker):
+        print(f"Generating data in {directory}...", flush=True)
+        generate(directory)
+        with open(marker, "w") as fp:
+            fp.write("")
+
+    return directory
+
+
+def record_stats(suite: Suite, server: LocalS3Server, scenario: str):
+    for operation, counts in server.stats.as_dict().items():
+        for name, count in counts.items():
+            suite.counts[f"{scenario} {operation} {name}"] = count
+
+    for line in server.stats.table().splitlines():
+        print(f"    {line}")
+
+
+def scrape(suite: Suite, server: LocalS3Server, work_dir: str, repeat: int):
+    public_dir = path.join(work_dir, "public")
+    cache_dir = path.join(work_dir, "cache")
+
+    def reset():
+        # Empty public bucket, source cache and the dedup index in the extract bucket
+        for directory in (
+            public_dir,
+            cache_dir,
+            path.join(work_dir, "extract", dedup.DEDUP_INDEX_PREFIX),
+            path.join(work_dir, ".metadata"),
+        ):
+            shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(public_dir)
+        os.makedirs(path.join(work_dir, "extract"), exist_ok=True)
+        server.stats.reset()
+
+    def clear_stats():
+        server.stats.reset()
+
+    def run():
+        handler.scrape("", "")
+
+    source.SOURCE_CACHE_DIR = cache_dir
+
+    suite.time("scrape cold", run, repeat=repeat, setup=reset)
+    record_stats(suite, server, "scrape cold")
+
+    suite.time(
+        "scrape warm",
+        run,
+        repeat=repeat,
+        setup=clear_stats,
+    )
+    record_stats(suite, server, "scrape warm")
+
+    for filename in sorted(os.listdir(public_dir)):
+        file_path = path.join(public_dir, filename)
+        if path.isfile(file_path) and filename != storage.MANIFEST_KEY:
+            with open(file_path, "rb") as fp:
+                content = storage.read_content(fp)
+            suite.outputs[filename] = hashlib.sha256(content).hexdigest()
+
+
+def extract(suite: Suite, server: LocalS3Server, work_dir: str, repeat: int):
+    extract_dir = path.join(work_dir, "extract")
+    source_dir = path.join(
+        server.storage.bucket_dir(os.environ["BUCKET_SOURCE_NAME_TWENTYONE"]),
+        JSONL_PATH,
+    )
+    keys = [
+        f"{JSONL_PATH}/{filename}"
+        for filename in sorted(os.listdir(source_dir))
+        if filename.endswith(".jsonl")
+    ]
+
+    def reset():
+        shutil.rmtree(extract_dir, ignore_errors=True)
+        os.makedirs(extract_dir)
+        server.stats.reset()
+
+    def run():
+        for key in keys:
+            handle_file(key)
+
+    suite.time("twentyone handle_file", run, repeat=repeat, setup=reset)
+    record_stats(suite, server, "twentyone")
+
+    for key in keys:
+        with open(path.join(extract_dir, f"{key}.csv"), "rb") as fp:
+            content = storage.read_content(fp)
+        suite.outputs[path.basename(key) + ".csv"] = hashlib.sha256(content).hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--years", type=int, default=2)
+    parser.add_argument("--cases-per-day", type=int, default=20)
+    parser.add_argument(
+        "--end",
+        type=dt.date.fromisoformat,
+        default=dt.date.today() - dt.timedelta(days=1),
+        help="Last day of synthetic data, defaults to yesterday",
+    )
+    parser.add_argument("--files", type=int, default=3)
+    parser.add_argument("--records", type=int, default=1000)
+    parser.add_argument(
+        "--latency", type=float, default=0.02, help="Seconds added to every request"
+    )
+    parser.add_argument(
+        "--bytes-per-second", type=float, default=None, help="Simulated bandwidth"
+    )
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logger.remove()
+        logger.add(sys.stderr, level="ERROR")
+
+    source_dir = prepare(
+        path.join(
+            args.data_dir,
+            f"{args.years}y-{args.cases_per_day}c-{args.end.isoformat()}",
+        ),
+        lambda directory: synthetic.generate(
+            directory, years=args.years, cases_per_day=args.cases_per_day, end=args.end
+        ),
+    )
+    twentyone_dir = prepare(
+        path.join(args.data_dir, f"twentyone-{args.files}f-{args.records}r"),
+        lambda directory: twentyone_synthetic.generate(
+            directory, files=args.files, records=args.records
+        ),
+    )
+
+    suite = Suite(
+        f"years={args.years},cases_per_day={args.cases_per_day},"
+        f"files={args.files},records={args.records},latency={args.latency}",
+        info={
+            "end": args.end.isoformat(),
+            "week": list(dt.date.today().isocalendar()[:2]),
+        },
+    )
+    print(f"{suite.name}:", flush=True)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        buckets = {
+            os.environ["BUCKET_SOURCE_NAME"]: source_dir,
+            os.environ["BUCKET_PUBLIC_NAME"]: path.join(work_dir, "public"),
+            os.environ["BUCKET_EXTRACT_NAME"]: path.join(work_dir, "extract"),
+            os.environ["BUCKET_SOURCE_NAME_TWENTYONE"]: path.join(
+                twentyone_dir, twentyone_synthetic.BUCKET
+            ),
+        }
+
+        with LocalS3Server(
+            work_dir,
+            buckets=buckets,
+            latency=args.latency,
+            bytes_per_second=args.bytes_per_second,
+        ) as server:
+            os.environ["S3_ENDPOINT_URL"] = server.endpoint_url
+            s3.set_client(None)
+
+            try:
+                scrape(suite, server, work_dir, args.repeat)
+                extract(suite, server, work_dir, args.repeat)
+            finally:
+                s3.set_client(None)
+
+    if args.save_baseline:
+        save_baseline(args.baseline, [suite])
+        return
+
+    if not check([suite], load_baseline(args.baseline)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Benchmarks the ik/in scrapers on synthetic data.
+
+Run with
+python -m benchmarks.scrapers [--years 1 5 20] [--save-baseline]
+
+For every scale, synthetic day files are generated once into ``--data-dir``.
+The benchmarks time filter_data, the history/districts/current functions of
+the private and regular scrapers and the write_data_* scrapers, which upload
+to an in-memory stand-in for S3. Timings and hashes of the uploaded files are
+compared with the baseline, and the command fails on regressions or changed
+outputs.
+"""
+
+import os
+
+# Source files are read from disk, the mode has to be set before importing
+os.environ["USE_LOCAL_FILES"] = "1"
+os.environ.setdefault("BUCKET_PUBLIC_NAME", "benchmark-public")
+
+import argparse
+import datetime as dt
+import hashlib
+from os import path
+import sys
+import tempfile
+
+from loguru import logger
+
+from benchmarks.harness import Suite, check, load_baseline, save_baseline
+from benchmarks.memory_s3 import MemoryS3
+from benchmarks.synthetic import generate
+from insolvenzen.scrapers import common, dedup, private, regular
+from insolvenzen.scrapers.both import write_data_both
+from insolvenzen.utils import s3, storage
+from insolvenzen.utils.source import CaseType, InsolvencyType
+
+BASELINE = path.join(path.dirname(__file__), "results", "scrapers.json")
+DATA_DIR = path.join(tempfile.gettempdir(), "insolvenzen-benchmark-data")
+
+
+def prepare_data(data_dir: str, years: int, cases_per_day: int, end: dt.date) -> str:
+    """
+    Generates the source files for a scale unless they exist already
+    """
+    scale_dir = path.join(data_dir, f"{years}y-{cases_per_day}c-{end.isoformat()}")
+    marker = path.join(scale_dir, "complete")
+
+    if not path.exists(marker):
+        print(f"Generating {years} years of data in {scale_dir}...", flush=True)
+        count = generate(scale_dir, years=years, cases_per_day=cases_per_day, end=end)
+        with open(marker, "w") as fp:
+            fp.write(str(count))
+
+    return scale_dir
+
+
+def publish_outputs(suite: Suite, repeat: int):
+    bucket = s3.bucket_name(storage.BUCKET_PUBLIC_ENV)
+    client = None
+
+    def setup():
+        nonlocal client
+
+        # Start from an empty bucket so every file is uploaded
+        client = MemoryS3()
+        s3.set_client(client)
+
+    for scraper in (private.write_data_private, regular.write_data_regular):
+        suite.time(scraper.__name__, scraper, repeat=repeat, setup=setup)
+        storage.save_manifests()
+
+    # write_data_both only produces one small file
+    suite.time("write_data_both", write_data_both, repeat=repeat)
+    storage.save_manifests()
+
+    # Collect outputs of all scrapers in one bucket
+    setup()
+    for scraper in (private.write_data_private, regular.write_data_regular):
+        scraper()
+    write_data_both()
+
+    for object_bucket, key in sorted(client.objects):
+        if object_bucket == bucket and key != storage.MANIFEST_KEY and "/" not in key:
+            content = client.content(object_bucket, key)
+            suite.outputs[key] = hashlib.sha256(content).hexdigest()
+
+    s3.set_client(None)
+
+
+def run_scale(args, years: int) -> Suite:
+    end = args.end
+    scale_dir = prepare_data(args.data_dir, years, args.cases_per_day, end)
+    os.environ["LOCAL_FILES"] = scale_dir
+
+    suite = Suite(
+        f"years={years},cases_per_day={args.cases_per_day}",
+        # Outputs depend on the data and, for regular.history, the current week
+        info={
+            "end": end.isoformat(),
+            "week": list(dt.date.today().isocalendar()[:2]),
+        },
+    )
+    print(f"{suite.name}:", flush=True)
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        dedup.DEDUP_INDEX_DIR = index_dir
+
+        for insolvency_type in InsolvencyType:
+            name = insolvency_type.value
+            suite.time(
+                f"filter_data[{name}] rebuild",
+                lambda: common.filter_data(insolvency_type, rebuild=True),
+                repeat=args.repeat,
+                setup=common.clear_caches,
+            )
+            suite.time(
+                f"filter_data[{name}] incremental",
+                lambda: common.filter_data(insolvency_type),
+                repeat=args.repeat,
+                setup=common.clear_caches,
+            )
+
+        for insolvency_type in InsolvencyType:
+            name = insolvency_type.value
+
+            def build_index():
+                common.release(insolvency_type)
+                common.filter_data(insolvency_type)
+
+            suite.time(
+                f"case_index[{name}]",
+                lambda: common.case_index(insolvency_type),
+                repeat=args.repeat,
+                setup=build_index,
+            )
+
+        # Aggregations run on the loaded datasets
+        suite.time("private.history", private.history, repeat=args.repeat)
+        suite.time("private.districts", private.districts, repeat=args.repeat)
+        suite.time("private.current", private.current, repeat=args.repeat)
+
+        for case_type in CaseType:
+            for function in (regular.history, regular.districts, regular.current):
+                suite.time(
+                    f"regular.{function.__name__}[{case_type.value}]",
+                    lambda: function(case_type),
+                    repeat=args.repeat,
+                )
+
+        publish_outputs(suite, args.repeat)
+        common.clear_caches()
+
+    return suite
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--years", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--cases-per-day", type=int, default=20)
+    parser.add_argument(
+        "--end",
+        type=dt.date.fromisoformat,
+        default=dt.date.today() - dt.timedelta(days=1),
+        help="Last day of synthetic data, defaults to yesterday",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logger.remove()
+        logger.add(sys.stderr, level="ERROR")
+
+    suites = [run_scale(args, years) for years in args.years]
+
+    if args.save_baseline:
+        save_baseline(args.baseline, suites)
+        return
+
+    if not check(suites, load_baseline(args.baseline)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Generates synthetic ik/ and in/ day files in the format of the source bucket.
+
+Run with
+python -m benchmarks.synthetic <output dir> [--years 5] [--cases-per-day 40]
+
+The files always cover 2018 and 2019, which the scrapers use as reference
+years, plus the given number of years up to ``--end``. Cases have nested
+courtcase-residences, and a share of them are duplicates, outside of NRW or
+without residences, like the real data.
+"""
+
+import argparse
+import datetime as dt
+import json
+import os
+from os import path
+import random
+from typing import List, Optional
+
+from insolvenzen.data.inhabitants import inhabitants
+from insolvenzen.utils.source import CaseType, InsolvencyType
+
+NRW = "Nordrhein-Westfalen"
+
+# kreis-name as used in the source data, for districts that are normalized
+KREIS_NAMES = {
+    "Köln": "Köln, Stadt",
+    "Bonn": "Bonn, Stadt",
+    "Hagen": "Hagen, Stadt der FernUniversität",
+    "Solingen": "Solingen, Klingenstadt",
+}
+NRW_DISTRICTS = [
+    KREIS_NAMES.get(name, name) for name in inhabitants if name != "Gesamt"
+]
+
+OTHER_DISTRICTS = {
+    "Bayern": ["München", "Nürnberg", "Augsburg"],
+    "Hessen": ["Frankfurt am Main", "Kassel", "Darmstadt"],
+    "Niedersachsen": ["Hannover", "Osnabrück", "Oldenburg (Oldb)"],
+    "Berlin": ["Berlin"],
+}
+
+COURTS = ["Köln", "Bonn", "Essen", "Dortmund", "Düsseldorf", "Münster", "München"]
+STREETS = ["Hauptstraße", "Bahnhofstraße", "Kirchweg", "Am Markt", "Lindenallee"]
+COMPANY_FORMS = ["GmbH", "GmbH & Co. KG", "UG (haftungsbeschränkt)", "AG", "e.K."]
+
+# Share of cases per file that repeat an earlier case
+DUPLICATE_SHARE = 0.1
+
+REFERENCE_YEARS = (2018, 2019)
+
+
+def date_range(years: int, end: dt.date) -> List[dt.date]:
+    """
+    Returns the weekdays of the reference years and of the last ``years``
+    years up to ``end``
+    """
+
+    def days(first: dt.date, last: dt.date):
+        return {first + dt.timedelta(days=i) for i in range((last - first).days + 1)}
+
+    dates = days(
+        end - dt.timedelta(days=round(365.25 * years)) + dt.timedelta(days=1), end
+    )
+    dates |= days(
+        dt.date(REFERENCE_YEARS[0], 1, 1),
+        min(dt.date(REFERENCE_YEARS[-1], 12, 31), end),
+    )
+
+    return sorted(date for date in dates if date.weekday() < 5)
+
+
+class Generator:
+    def __init__(self, seed: int = 1, cases_per_day: int = 40):
+        self.random = random.Random(seed)
+        self.cases_per_day = cases_per_day
+        self.counter = 0
+        self.recent = {insolvency_type: [] for insolvency_type in InsolvencyType}
+
+    def residence(self, state: str, kreis: str) -> dict:
+        return {
+            "geolocation-street": {
+                "street-name": self.random.choice(STREETS),
+                "street-number": str(self.random.randint(1, 200)),
+                "street-gemeinde": {
+                    "gemeinde-name": kreis.split(",")[0],
+                    "gemeinde-plz": f"{self.random.randint(10000, 99999)}",
+                    "gemeinde-kreis": {
+                        "kreis-name": kreis,
+                        "kreis-bundesland": {"bundesland-name": state},
+                    },
+                },
+            }
+        }
+
+    def residences(self) -> Optional[list]:
+        r = self.random.random()
+
+        if r < 0.05:
+            # Some cases have no residences at all, some an empty list
+            return None if self.random.random() < 0.5 else []
+
+        if r < 0.45:
+            state = self.random.choice(list(OTHER_DISTRICTS))
+            return [self.residence(state, self.random.choice(OTHER_DISTRICTS[state]))]
+
+        nrw = self.residence(NRW, self.random.choice(NRW_DISTRICTS))
+        if r < 0.55:
+            state = self.random.choice(list(OTHER_DISTRICTS))
+            return [
+                self.residence(state, self.random.choice(OTHER_DISTRICTS[state])),
+                nrw,
+            ]
+
+        return [nrw]
+
+    def case(self, insolvency_type: InsolvencyType, date: dt.date) -> dict:
+        recent = self.recent[insolvency_type]
+        if recent and self.random.random() < DUPLICATE_SHARE:
+            return json.loads(json.dumps(self.random.choice(recent)))
+
+        self.counter += 1
+        is_company = (
+            insolvency_type == InsolvencyType.REGULAR and self.random.random() < 0.6
+        )
+        kind = insolvency_type.value.upper()
+        name = (
+            f"Muster {self.counter} {self.random.choice(COMPANY_FORMS)}"
+            if is_company
+            else f"Erika Mustermann {self.counter}"
+        )
+
+        case = {
+            "courtcase-aktenzeichen": f"{self.random.randint(1, 99)} {kind} {self.counter}/{date.year % 100}",
+            "courtcase-court": self.random.choice(COURTS),
+            "courtcase-is-company": is_company,
+            "courtcase-company-names": [name] if is_company else [],
+            "courtcase-date": date.isoformat(),
+            "courtcase-text": (
+                f"In dem Insolvenzverfahren über das Vermögen von {name} wird "
+                "heute das Insolvenzverfahren eröffnet. " * 5
+            ),
+        }
+
+        residences = self.residences()
+        if residences is not None:
+            case["courtcase-residences"] = residences
+
+        recent.append(case)
+        if len(recent) > 500:
+            recent.pop(0)
+
+        return case
+
+    def day_file(self, insolvency_type: InsolvencyType, date: dt.date) -> dict:
+        data = {}
+
+        for case_type in CaseType:
+            # Private insolvencies are mostly openings
+            if (
+                insolvency_type == InsolvencyType.PRIVATE
+                and case_type != CaseType.VERFAHRENEROEFFNET
+                and self.random.random() < 0.5
+            ):
+                continue
+
+            count = self.random.randint(self.cases_per_day // 2, self.cases_per_day)
+            data[case_type.value] = [
+                self.case(insolvency_type, date) for _ in range(count)
+            ]
+
+        return data
+
+
+def generate(
+    output_dir: str,
+    *,
+    years: int = 5,
+    cases_per_day: int = 40,
+    end: Optional[dt.date] = None,
+    seed: int = 1,
+) -> int:
+    """
+    Writes day files to ``output_dir``/ik and ``output_dir``/in and returns
+    the number of files per insolvency type
+    """
+    end = end or dt.date.today() - dt.timedelta(days=1)
+    generator = Generator(seed, cases_per_day)
+    dates = date_range(years, end)
+
+    for insolvency_type in InsolvencyType:
+        os.makedirs(path.join(output_dir, insolvency_type.value), exist_ok=True)
+
+    for date in dates:
+        for insolvency_type in InsolvencyType:
+            file_path = path.join(
+                output_dir, insolvency_type.value, f"{date.isoformat()}.json"
+            )
+            with open(file_path, "w", encoding="utf-8") as fp:
+                json.dump(generator.day_file(insolvency_type, date), fp)
+
+    return len(dates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("output_dir")
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--cases-per-day", type=int, default=40)
+    parser.add_argument("--end", type=dt.date.fromisoformat, default=None)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    count = generate(
+        args.output_dir,
+        years=args.years,
+        cases_per_day=args.cases_per_day,
+        end=args.end,
+        seed=args.seed,
+    )
+    print(f"Wrote {count} files per insolvency type to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+Benchmarks the twentyone extract/export/analyze pipeline on synthetic data.
+
+Run with
+python -m benchmarks.twentyone [--files 5] [--records 2000] [--repeat-share 0.6]
+[--save-baseline]
+
+Synthetic JSONL files are generated once into ``--data-dir``, each repeating
+``--repeat-share`` of the records of the previous file like the scraper
+snapshots. The benchmarks time loading the cases of a file, extract_features
+and its batch version, export_cases, the sequential and concurrent runs over
+all files, analysis.load_data with and without filters and its cache, and
+reading the deduplicated cases. If pyarrow is installed, the Parquet export
+and reading it are timed as well. The exporter writes to ``extracted/`` in a
+temporary working directory, and hashes of the extracted CSVs are compared
+with the baseline like the timings.
+"""
+
+import os
+
+# Files are read from and exported to disk, the mode has to be set before importing
+os.environ["USE_LOCAL_FILES"] = "1"
+
+import argparse
+from contextlib import redirect_stdout
+import copy
+import hashlib
+import importlib.util
+import io
+from pathlib import Path
+from os import path
+import shutil
+import sys
+import tempfile
+
+from loguru import logger
+
+from benchmarks.harness import Suite, check, load_baseline, save_baseline
+from benchmarks.twentyone_synthetic import BUCKET, generate
+from insolvenzen import twentyone
+from insolvenzen.twentyone import analysis
+from insolvenzen.twentyone.exporter import export_cases
+from insolvenzen.twentyone.extractor import (
+    extract_features,
+    extract_features_batch,
+)
+from insolvenzen.twentyone.loader import get_cases, list_files
+
+BASELINE = path.join(path.dirname(__file__), "results", "twentyone.json")
+DATA_DIR = path.join(tempfile.gettempdir(), "insolvenzen-benchmark-twentyone")
+
+
+def prepare_data(data_dir: str, files: int, records: int, repeat_share: float) -> str:
+    """
+    Generates the JSONL files for a scale unless they exist already
+    """
+    scale_dir = path.join(data_dir, f"{files}f-{records}r-{repeat_share}rep")
+    marker = path.join(scale_dir, "complete")
+
+    if not path.exists(marker):
+        print(f"Generating {files} files of data in {scale_dir}...", flush=True)
+        generate(scale_dir, files=files, records=records, repeat_share=repeat_share)
+        with open(marker, "w") as fp:
+            fp.write(str(files))
+
+    return scale_dir
+
+
+def extracted_outputs(suite: Suite):
+    for file_path in sorted(Path("extracted").rglob("*.csv")):
+        suite.outputs[file_path.name] = hashlib.sha256(
+            file_path.read_bytes()
+        ).hexdigest()
+
+
+def worker_counts() -> list:
+    cpus = os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 < cpus:
+        counts.append(counts[-1] * 2)
+    if cpus > 1:
+        counts.append(cpus)
+    return counts
+
+
+def run_scale(args, work_dir: str) -> Suite:
+    scale_dir = prepare_data(args.data_dir, args.files, args.records, args.repeat_share)
+
+    # The exporter writes below the relative source path, so the source is
+    # linked into the working directory
+    source = path.join(work_dir, "source")
+    os.symlink(scale_dir, source)
+    os.environ["LOCAL_FILES_TWENTYONE"] = "source"
+    os.environ["BUCKET_SOURCE_NAME_TWENTYONE"] = BUCKET
+
+    suite = Suite(
+        f"files={args.files},records={args.records},repeat_share={args.repeat_share}",
+        info={
+            "files": args.files,
+            "records": args.records,
+            "repeat_share": args.repeat_share,
+        },
+    )
+    print(f"{suite.name}:", flush=True)
+
+    filenames = list_files()
+    filename = filenames[0]
+    records = args.records
+
+    suite.time(
+        "get_cases",
+        lambda: list(get_cases(filename)),
+        repeat=args.repeat,
+        count=records,
+    )
+
+    # extract_features changes the cases in place
+    for fmt, sample in (("alt", filenames[0]), ("neu", filenames[-1])):
+        raw_cases = list(get_cases(sample))
+        copies = []
+
+        def setup():
+            copies[:] = copy.deepcopy(raw_cases)
+
+        extracted = suite.time(
+            f"extract_features[{fmt}]",
+            lambda: [extract_features(case) for case in copies],
+            repeat=args.repeat,
+            setup=setup,
+            count=records,
+        )
+        suite.time(
+            f"extract_features_batch[{fmt}]",
+            lambda: extract_features_batch(copies),
+            repeat=args.repeat,
+            setup=setup,
+            count=records,
+        )
+
+    suite.time(
+        "export_cases",
+        lambda: export_cases(extracted, filenames[-1]),
+        repeat=args.repeat,
+        count=records,
+    )
+
+    def clean():
+        shutil.rmtree("extracted", ignore_errors=True)
+
+    suite.time(
+        "run",
+        twentyone.run,
+        repeat=args.repeat,
+        setup=clean,
+        count=records * len(filenames),
+    )
+    extracted_outputs(suite)
+
+    for workers in worker_counts():
+        suite.time(
+            f"run_concurrent[workers={workers}]",
+            lambda: twentyone.run_concurrent(max_workers=workers),
+            repeat=args.repeat,
+            setup=clean,
+            count=records * len(filenames),
+        )
+
+    def load_data(**kwargs):
+        # load_data prints the cache it reads
+        with redirect_stdout(io.StringIO()):
+            return analysis.load_data(**kwargs)
+
+    def clear_cache():
+        shutil.rmtree(analysis.CACHE_DIR, ignore_errors=True)
+
+    df = suite.time(
+        "analysis.load_data",
+        lambda: load_data(cache=False),
+        repeat=args.repeat,
+        count=records * len(filenames),
+    )
+    assert len(df) == records * len(filenames)
+
+    suite.time(
+        "analysis.load_data[filtered]",
+        lambda: load_data(
+            columns=analysis.ANALYSIS_COLUMNS,
+            federal_states=["Nordrhein-Westfalen", "nw"],
+            kinds=["ik"],
+            cache=False,
+        ),
+        repeat=args.repeat,
+        count=records * len(filenames),
+    )
+
+    for name, setup in (("cold", clear_cache), ("warm", None)):
+        cached = suite.time(
+            f"analysis.load_data[cache {name}]",
+            load_data,
+            repeat=args.repeat,
+            setup=setup,
+            count=records * len(filenames),
+        )
+        assert cached.equals(df)
+
+    def load_deduplicated():
+        with redirect_stdout(io.StringIO()):
+            return analysis.load_deduplicated()
+
+    suite.time(
+        "analysis.load_deduplicated",
+        load_deduplicated,
+        repeat=args.repeat,
+        count=records * len(filenames),
+    )
+
+    if importlib.util.find_spec("pyarrow") is not None:
+        columnar(suite, args, extracted, clean)
+
+    return suite
+
+
+def columnar(suite: Suite, args, extracted: list, clean):
+    """
+    Times the Parquet export and reading the columns used by the analysis
+    """
+    filenames = list_files()
+    count = args.records * len(filenames)
+    os.environ["EXPORT_FORMAT"] = "parquet"
+
+    try:
+        suite.time(
+            "export_cases[parquet]",
+            lambda: export_cases(extracted, filenames[-1]),
+            repeat=args.repeat,
+            count=args.records,
+        )
+        suite.time(
+            "run[parquet]", twentyone.run, repeat=args.repeat, setup=clean, count=count
+        )
+
+        def load_data():
+            with redirect_stdout(io.StringIO()):
+                return analysis.load_data(analysis.ANALYSIS_COLUMNS, cache=False)
+
+        suite.time(
+            "analysis.load_data[parquet]",
+            load_data,
+            repeat=args.repeat,
+            count=count,
+        )
+    finally:
+        del os.environ["EXPORT_FORMAT"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=5)
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument(
+        "--repeat-share",
+        type=float,
+        default=0.6,
+        help="Share of the records of the previous file repeated in each file",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    args.data_dir = path.abspath(args.data_dir)
+    args.baseline = path.abspath(args.baseline)
+
+    if not args.verbose:
+        logger.remove()
+        logger.add(sys.stderr, level="ERROR")
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        try:
+            suite = run_scale(args, work_dir)
+        finally:
+            os.chdir(cwd)
+
+    if args.save_baseline:
+        save_baseline(args.baseline, [suite])
+        return
+
+    if not check([suite], load_baseline(args.baseline)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Generates synthetic JSONL files in the format of the
+insolvenzbekanntmachungen-scraper.
+
+Run with
+python -m benchmarks.twentyone_synthetic <output dir> [--files 10] [--records 5000]
+
+Files are written to ``<output dir>/<bucket>/insolvenzbekanntmachungen-scraper``
+like a local clone of the source bucket. Early files use the ``alt`` format
+with file_name and url, later ones the ``neu`` format with kind and detail
+form fields.
+
+Like the scraper snapshots, every file repeats ``--repeat-share`` of the
+records of the previous file in the same format, some of them with a field
+blanked or changed, so the same description is extracted from many files.
+"""
+
+import argparse
+import datetime as dt
+import hashlib
+import json
+import os
+from os import path
+import random
+from typing import List
+
+from insolvenzen.twentyone.loader import JSONL_PATH
+
+BUCKET = "insolvenzbekanntmachungen"
+
+# Federal states as written by the old and new format
+FEDERAL_STATES = {
+    "bw": "Baden-Württemberg",
+    "by": "Bayern",
+    "be": "Berlin",
+    "hb": "Bremen",
+    "hh": "Hamburg",
+    "he": "Hessen",
+    "ni": "Niedersachsen",
+    "nw": "Nordrhein-Westfalen",
+    "rp": "Rheinland-Pfalz",
+    "sn": "Sachsen",
+}
+COURTS = ["Köln", "Düsseldorf", "Essen", "Dortmund", "München", "Hamburg", "Hannover"]
+CITIES = ["Köln", "Bonn", "Essen", "Münster", "Bielefeld", "Aachen", "Hagen"]
+FIRST_NAMES = ["Anna", "Peter", "Fatma", "Jürgen", "Sabine", "Mehmet", "Ursula"]
+LAST_NAMES = ["Müller", "Schmidt", "Yılmaz", "Schneider", "Fischer", "Weber"]
+COMPANY_FORMS = ["GmbH", "GmbH & Co. KG", "UG (haftungsbeschränkt)", "AG"]
+
+# (file_name part of the old format, kind of the new format)
+PROCEEDING_TYPES = [
+    ("Eröffnungen", "Eroeffnung Insolvenzverfahren"),
+    ("Sicherungsmaßnahmen", "Sicherungsmassnahmen"),
+    ("Abweisungen mangels Masse", "Abweisung mangels Masse"),
+    ("Entscheidungen im Verfahren", "Entscheidungen im Verfahren"),
+    ("Restschuldbefreiung", "Restschuldbefreiung"),
+]
+
+
+def german_date(date: dt.date) -> str:
+    return date.strftime("%d.%m.%Y")
+
+
+class Generator:
+    def __init__(self, seed: int = 1):
+        self.random = random.Random(seed)
+        self.counter = 0
+
+    def description(self, kind: str, name: str, published: dt.date) -> str:
+        is_private = kind == "IK"
+        zipcode = f"{self.random.randint(10000, 99999)}"
+        street = f"{self.random.choice(['Hauptstraße', 'Ringstr.', 'Am Markt'])} {self.random.randint(1, 120)}"
+        city = self.random.choice(CITIES)
+
+        parts = [
+            "Öffentliche Bekanntmachung",
+            f"{self.random.randint(1, 99)} {kind} {self.counter}/{published.year % 100}",
+            f"In dem Insolvenzverfahren über das Vermögen d. {name},",
+        ]
+
+        if is_private and self.random.random() < 0.8:
+            birthday = dt.date(self.random.randint(1940, 2000), 1, 1) + dt.timedelta(
+                days=self.random.randint(0, 364)
+            )
+            born = self.random.choice(["geb. am", "geboren am", "geb."])
+            parts.append(f"{born} {german_date(birthday)},")
+
+        parts.append(f"{street}, {zipcode} {city},")
+        parts.append(
+            "wird wegen Zahlungsunfähigkeit heute das Insolvenzverfahren eröffnet. "
+            "Forderungen der Insolvenzgläubiger sind bis zum "
+            f"{german_date(published + dt.timedelta(days=40))} bei dem "
+            "Insolvenzverwalter anzumelden."
+        )
+
+        # Most descriptions end with the date of the proceeding
+        if self.random.random() < 0.95:
+            proceeding = published - dt.timedelta(days=self.random.randint(0, 5))
+            parts.append(
+                f"Amtsgericht {self.random.choice(COURTS)}, {german_date(proceeding)}"
+            )
+
+        return " ".join(parts)
+
+    def record(self, published: dt.date, new_format: bool) -> dict:
+        self.counter += 1
+
+        kind = "IK" if self.random.random() < 0.55 else "IN"
+        if kind == "IK":
+            name = f"{self.random.choice(FIRST_NAMES)} {self.random.choice(LAST_NAMES)}"
+        else:
+            name = (
+                f"{self.random.choice(LAST_NAMES)} {self.random.choice(COMPANY_FORMS)}"
+            )
+
+        state_code = self.random.choice(list(FEDERAL_STATES))
+        case_nr = (
+            f"{self.random.randint(1, 99)} {kind} {self.counter}/{published.year % 100}"
+        )
+        file_type, new_kind = self.random.choice(PROCEEDING_TYPES)
+
+        record = {
+            "date": published.isoformat(),
+            "case_nr": case_nr,
+            "court": self.random.choice(COURTS),
+            "description": self.description(kind, name, published),
+        }
+
+        if new_format:
+            record.update(
+                {
+                    "format": "neu",
+                    "federal_state": FEDERAL_STATES[state_code],
+                    "kind": new_kind,
+                    "detail_form_name": f"detail_{self.counter}",
+                    "name": name,
+                    "request_fingerprint": hashlib.sha1(
+                        str(self.counter).encode("utf-8")
+                    ).hexdigest(),
+                }
+            )
+            if self.random.random() < 0.15:
+                record["register"] = f"HRB {self.random.randint(1000, 99999)}"
+        else:
+            file_name = (
+                f"{state_code}_{published.strftime('%Y%m%d')}_"
+                f"{self.counter:06d}_{file_type}.htm"
+            )
+            record.update(
+                {
+                    "federal_state": state_code,
+                    "file_name": file_name,
+                    "url": f"https://www.insolvenzbekanntmachungen.de/cgi-bin/bl_aufruf.pl?datei=gerichte/{state_code}/{file_name}",
+                    "title": f"{published.isoformat()} {case_nr}",
+                }
+            )
+            if self.random.random() < 0.05:
+                record["_type"] = "InsolvencyItem"
+            if self.random.random() < 0.05:
+                record["_key"] = record["url"]
+
+        return record
+
+    def vary(self, record: dict) -> dict:
+        """
+        Returns a copy of a repeated record with one field blanked or changed,
+        keeping the description
+        """
+        record = dict(record)
+        field = self.random.choice(
+            [name for name in ("court", "name", "title", "register") if name in record]
+        )
+
+        if field == "register" or self.random.random() < 0.5:
+            record[field] = ""
+        elif field == "court":
+            record[field] = self.random.choice(COURTS)
+        else:
+            record[field] = f"{record[field]} (berichtigt)"
+
+        return record
+
+
+def generate(
+    output_dir: str,
+    *,
+    files: int = 10,
+    records: int = 5000,
+    new_format_share: float = 0.5,
+    repeat_share: float = 0.6,
+    change_share: float = 0.2,
+    seed: int = 1,
+) -> List[str]:
+    """
+    Writes JSONL files and returns their paths. The first files use the old
+    format, the rest the new one.
+
+    Each file starts with ``repeat_share`` of the records of the previous
+    file, unless the format changed, and ``change_share`` of those repeats
+    have a field blanked or changed.
+    """
+    generator = Generator(seed)
+    directory = path.join(output_dir, BUCKET, JSONL_PATH)
+    os.makedirs(directory, exist_ok=True)
+
+    start = dt.datetime(2021, 1, 4, 3, 0, 0)
+    new_format_from = round(files * (1 - new_format_share))
+    paths = []
+    previous = []
+
+    for i in range(files):
+        scraped = start + dt.timedelta(
+            days=7 * i, minutes=generator.random.randint(0, 59)
+        )
+        file_path = path.join(directory, scraped.strftime("%Y-%m-%dT%H-%M-%S.jsonl"))
+        new_format = i >= new_format_from
+
+        # The old and new format are different scrapers, which don't overlap
+        repeated = []
+        if previous and new_format == (i - 1 >= new_format_from):
+            repeated = generator.random.sample(
+                previous, min(len(previous), round(records * repeat_share))
+            )
+            repeated = [
+                (
+                    generator.vary(record)
+                    if generator.random.random() < change_share
+                    else record
+                )
+                for record in repeated
+            ]
+
+        current = repeated
+        for _ in range(records - len(repeated)):
+            published = scraped.date() - dt.timedelta(
+                days=generator.random.randint(0, 6)
+            )
+            current.append(generator.record(published, new_format))
+
+        with open(file_path, "w", encoding="utf-8") as fp:
+            for record in current:
+                fp.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        paths.append(file_path)
+        previous = current
+
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("output_dir")
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--records", type=int, default=5000)
+    parser.add_argument("--new-format-share", type=float, default=0.5)
+    parser.add_argument("--repeat-share", type=float, default=0.6)
+    parser.add_argument("--change-share", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    paths = generate(
+        args.output_dir,
+        files=args.files,
+        records=args.records,
+        new_format_share=args.new_format_share,
+        repeat_share=args.repeat_share,
+        change_share=args.change_share,
+        seed=args.seed,
+    )
+    print(f"Wrote {len(paths)} files to {path.dirname(paths[0])}")
+
+
+if __name__ == "__main__":
+    main()
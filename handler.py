@@ -1,5 +1,4 @@
 import json
-import datetime
 import os
 
 from loguru import logger
@@ -8,7 +7,9 @@ from sentry_sdk.integrations.aws_lambda import AwsLambdaIntegration
 
 sentry_sdk.init(os.environ["SENTRY_URI"], integrations=[AwsLambdaIntegration()])
 
-from insolvenzen.scrapers.common import clear_caches
+from insolvenzen.scrapers.scheduler import run_scrapers
+from insolvenzen.utils.metrics import Collector
+from insolvenzen.utils.storage import save_manifests
 
 # Import your scraper here ⬇️
 from insolvenzen.scrapers.private import write_data_private
@@ -16,31 +17,34 @@ from insolvenzen.scrapers.regular import write_data_regular
 from insolvenzen.scrapers.both import write_data_both
 
 # Add your scraper here ⬇️, without () at the end
+# Declare the datasets it reads with @consumes from insolvenzen.scrapers.scheduler
 SCRAPERS = [
     write_data_private,
-    clear_caches,
     write_data_regular,
     write_data_both,
 ]
 
 
 def scrape(event, context):
-    for scraper in SCRAPERS:
-        scraper_name = scraper.__name__
-        with sentry_sdk.configure_scope() as scope:
-            scope.set_tag("scraper", scraper_name)
-            try:
-                scraper()
-                now = datetime.datetime.now()
-                logger.info(f"Updated {scraper_name} at {now}")
-            except Exception as e:
-                # Catch and send error to Sentry manually so we can continue
-                # running other scrapers if one fails
-                logger.exception(f"Scraper {scraper_name} failed with {e}")
-                sentry_sdk.capture_exception(e)
+    collector = Collector()
+    results = run_scrapers(SCRAPERS, collector=collector)
+
+    # Remember hashes of uploaded files for change detection in the next run
+    try:
+        with collector.record("run", "save_manifests"):
+            save_manifests()
+    except Exception as e:
+        logger.exception(f"Saving manifests failed with {e}")
+        sentry_sdk.capture_exception(e)
+
+    collector.emit()
+
+    failed = [result.name for result in results if result.error is not None]
 
     body = {
-        "message": f"Ran {len(SCRAPERS)} scrapers successfully.",
+        "message": f"Ran {len(SCRAPERS) - len(failed)} of {len(SCRAPERS)} scrapers successfully.",
+        "failed": failed,
+        "metrics": collector.as_dict(),
     }
 
     response = {"statusCode": 200, "body": json.dumps(body)}
@@ -1,11 +1,13 @@
 import pandas as pd
 
-from insolvenzen.utils.source import CaseType
-from insolvenzen.utils.storage import upload_dataframe
+from insolvenzen.scrapers.scheduler import consumes
+from insolvenzen.utils.source import CaseType, InsolvencyType
+from insolvenzen.utils.storage import PublishQueue
 from . import private
 from . import regular
 
 
+@consumes(InsolvencyType.PRIVATE, InsolvencyType.REGULAR)
 def write_data_both():
     current_private = private.current()
 
@@ -14,7 +16,10 @@ def write_data_both():
         current_regulars.append(regular.current(case_type))
 
     current_both = pd.concat([current_private] + current_regulars)
-    upload_dataframe(current_both, f"both_current.csv")
+
+    queue = PublishQueue()
+    queue.submit(current_both, f"both_current.csv")
+    queue.publish()
 
 
 if __name__ == "__main__":
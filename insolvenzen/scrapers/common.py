@@ -1,15 +1,28 @@
-from collections import defaultdict
-import datetime as dt
-from functools import lru_cache
+import os
+from threading import RLock
+from typing import Dict
 
 from loguru import logger
+import numpy as np
 
+from insolvenzen.scrapers.dedup import DedupIndex
+from insolvenzen.scrapers.index import CaseIndex
+from insolvenzen.utils.metrics import stage
 from insolvenzen.utils.source import (
     CaseType,
-    load_source_file,
-    list_files,
+    InsolvencyType,
+    iter_source_files,
+    list_source_objects,
+    open_source_cache,
+    save_source_cache,
 )
 
+REBUILD_DEDUP_INDEX = bool(os.environ.get("REBUILD_DEDUP_INDEX"))
+
+# Filtered cases and case index of each insolvency type, kept until released
+_datasets: Dict[InsolvencyType, dict] = {}
+_dataset_locks = {insolvency_type: RLock() for insolvency_type in InsolvencyType}
+
 
 def signed(number):
     prefix = ""
@@ -19,76 +32,102 @@ def signed(number):
     return f"{prefix}{number}"
 
 
-def in_nrw(residence):
+def iter_files(insolvency_type, source_objects=None):
     """
-    Checks if the given residence is in NRW
+    Generates (date, file) for the projected source files one at a time
     """
-    return (
-        residence["geolocation-street"]["street-gemeinde"]["gemeinde-kreis"][
-            "kreis-bundesland"
-        ]["bundesland-name"]
-        == "Nordrhein-Westfalen"
-    )
+    if source_objects is None:
+        source_objects = list_source_objects(insolvency_type)
 
+    cache = open_source_cache()
 
-@lru_cache
-def get_files(insolvency_type):
-    filenames = list_files(insolvency_type)
-    files = {
-        dt.date.fromisoformat(filename[:10]): load_source_file(
-            insolvency_type, filename
+    try:
+        yield from iter_source_files(
+            insolvency_type, source_objects, cache=cache, projected=True
         )
-        for filename in filenames
-    }
-    return files
+    finally:
+        save_source_cache(cache)
+
+    logger.info(
+        "Loaded {} {} files, {} of them from cache",
+        len(source_objects),
+        insolvency_type.value,
+        cache.hits,
+    )
+
+
+def filter_data(insolvency_type, rebuild=False):
+    """
+    Returns the deduplicated cases and stats of an insolvency type, computing
+    them on first use until the dataset is released.
+
+    With ``rebuild``, the dataset is released and the dedup index is rebuilt
+    from all source files, which REBUILD_DEDUP_INDEX does on every load.
+    """
+    with _dataset_locks[insolvency_type]:
+        if rebuild:
+            release(insolvency_type)
+
+        dataset = _datasets.setdefault(insolvency_type, {})
+        if "cases" not in dataset:
+            dataset["cases"] = _filter_data(
+                insolvency_type, rebuild or REBUILD_DEDUP_INDEX
+            )
 
+        return dataset["cases"]
 
-@lru_cache
-def filter_data(insolvency_type):
-    files = get_files(insolvency_type)
 
-    court_case_numbers = {case_type: set() for case_type in CaseType}
-    cases = {case_type: list() for case_type in CaseType}
-    stats = {case_type: defaultdict(int) for case_type in CaseType}
+def _filter_data(insolvency_type, rebuild):
+    with stage("list"):
+        source_objects = sorted(
+            list_source_objects(insolvency_type),
+            key=lambda source_object: source_object.filename,
+        )
+
+    dedup_index = None if rebuild else DedupIndex.load(insolvency_type)
+    new_objects = None
 
-    def process_cases(date, fil, case_type):
-        for case in fil.get(case_type.value, []):
-            # Count total cases
-            stats[case_type]["total_cases"] += 1
+    if dedup_index is not None:
+        new_objects = dedup_index.new_source_objects(source_objects)
 
-            # Test if entry contains courtcase residences
-            if not case.get("courtcase-residences", []):
-                stats[case_type]["no_courtcase_residences"] += 1
-                continue
+    if new_objects is None:
+        logger.info("Rebuilding {} dedup index", insolvency_type.value)
+        dedup_index = DedupIndex(insolvency_type)
+        new_objects = source_objects
 
-            # Not in NRW
-            if not any(
-                in_nrw(residence) for residence in case.get("courtcase-residences", [])
-            ):
-                continue
+    logger.info(
+        "Processing {} new of {} {} files",
+        len(new_objects),
+        len(source_objects),
+        insolvency_type.value,
+    )
 
-            court_case_number = case["courtcase-aktenzeichen"]
-            court = case["courtcase-court"]
-            unique_case_number = (court, court_case_number)
+    files = iter_files(insolvency_type, new_objects)
 
-            # Duplicate court case number
-            if unique_case_number in court_case_numbers[case_type]:
-                stats[case_type]["nrw_duplicates"] += 1
-                continue
+    for source_object in new_objects:
+        with stage("download"):
+            date, fil = next(files)
 
-            court_case_numbers[case_type].add(unique_case_number)
+        with stage("filter"):
+            dedup_index.add_file(date, fil, source_object)
 
-            # Add custom properties
-            case["date"] = date
+    # Finish the generator so the cache is saved and statistics are logged
+    with stage("download"):
+        next(files, None)
 
-            # Add proceeding to the list
-            cases[case_type].append(case)
+    with stage("filter"):
+        # Rows stay in date order, which the helpers below rely on
+        cases = dedup_index.cases()
+        stats = dedup_index.stats
 
-    # Filter irrelevant and duplicate values
-    for date, fil in files.items():
-        process_cases(date, fil, CaseType.ABWEISUNGMANGELSMASSE)
-        process_cases(date, fil, CaseType.SICHERUNGSMASSNAHMEN)
-        process_cases(date, fil, CaseType.VERFAHRENEROEFFNET)
+        if new_objects:
+            # The index only saves work on the next run, the cases are complete
+            try:
+                dedup_index.save()
+            except Exception as e:
+                logger.warning(
+                    "Could not save {} dedup index: {}", insolvency_type.value, e
+                )
 
     logger.info(
         f"Found a total of {stats[CaseType.VERFAHRENEROEFFNET]['total_cases']} in all of DE"
@@ -101,7 +140,7 @@ def filter_data(insolvency_type):
 
     logger.info(
         "Found {} relevant proceedings",
-        len(cases[CaseType.VERFAHRENEROEFFNET]),
+        len(select_cases(cases, CaseType.VERFAHRENEROEFFNET)),
     )
     logger.info(
         f"{stats[CaseType.VERFAHRENEROEFFNET]['nrw_duplicates']} proceedings in "
@@ -111,6 +150,40 @@ def filter_data(insolvency_type):
     return cases, stats
 
 
+def case_index(insolvency_type):
+    with _dataset_locks[insolvency_type]:
+        cases, stats = filter_data(insolvency_type)
+
+        dataset = _datasets[insolvency_type]
+        if "index" not in dataset:
+            with stage("aggregate"):
+                dataset["index"] = CaseIndex(cases)
+
+        return dataset["index"]
+
+
+def release(insolvency_type):
+    """
+    Frees the cases and case index of an insolvency type
+    """
+    with _dataset_locks[insolvency_type]:
+        _datasets.pop(insolvency_type, None)
+
+
+def select_cases(cases, case_type):
+    """
+    Returns the rows of the case table that belong to the given case type
+    """
+    return cases[cases["case_type"] == case_type.value]
+
+
+def repeated_sum(value, count):
+    """
+    Adds up value count times with the same rounding as a running sum
+    """
+    return float(np.full(count, value).cumsum()[-1])
+
+
 def clear_caches():
-    get_files.cache_clear()
-    filter_data.cache_clear()
+    for insolvency_type in InsolvencyType:
+        release(insolvency_type)
@@ -1,21 +1,18 @@
-import datetime as dt
 from functools import lru_cache
 from collections import defaultdict
 
-from insolvenzen.utils.source import InsolvencyType, load_source_file, list_files
+from insolvenzen.utils.source import (
+    InsolvencyType,
+    list_source_objects,
+    load_source_files,
+)
 
 
 @lru_cache
 def get_files():
     # Download website
-    filenames = list_files(InsolvencyType.REGULAR)
-    files = {
-        dt.date.fromisoformat(filename[:10]): load_source_file(
-            InsolvencyType.REGULAR, filename
-        )
-        for filename in filenames
-    }
-    return files
+    source_objects = list_source_objects(InsolvencyType.REGULAR)
+    return load_source_files(InsolvencyType.REGULAR, source_objects)
 
 
 files = get_files()
@@ -0,0 +1,283 @@
+from collections import defaultdict
+import gzip
+import json
+import os
+from os import path
+from typing import Dict, List, Optional
+
+from loguru import logger
+import numpy as np
+import pandas as pd
+
+from insolvenzen.data import normalize
+from insolvenzen.utils.s3 import bucket_name, get_client
+from insolvenzen.utils.source import (
+    SOURCE_CACHE_DIR,
+    USE_LOCAL_FILES,
+    CaseType,
+    InsolvencyType,
+    SourceObject,
+    project_case,
+)
+
+DEDUP_INDEX_DIR = os.environ.get("DEDUP_INDEX_DIR", SOURCE_CACHE_DIR)
+
+# Where the index is kept between runs: "s3" as a private object in the extract
+# bucket, or "local" in DEDUP_INDEX_DIR. The scrape Lambda runs once a day, so
+# its /tmp is usually gone by the next run.
+DEDUP_INDEX_BACKEND = os.environ.get(
+    "DEDUP_INDEX_BACKEND", "local" if USE_LOCAL_FILES else "s3"
+)
+DEDUP_INDEX_PREFIX = "dedup"
+BUCKET_DEDUP_INDEX_ENV = "BUCKET_EXTRACT_NAME"
+
+COLUMNS = ["date", "court", "aktenzeichen", "case_type", "district", "is_company"]
+
+
+def plain_values(series: pd.Series) -> list:
+    """
+    Returns the values of a column as JSON-serializable Python objects, with
+    missing values as None
+    """
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def make_case_table(columns: Dict[str, list]) -> pd.DataFrame:
+    """
+    Builds the typed case table from plain column lists or arrays
+    """
+    return pd.DataFrame(
+        {
+            "date": pd.to_datetime(columns["date"]),
+            "court": pd.Categorical(columns["court"]),
+            "aktenzeichen": np.asarray(columns["aktenzeichen"], dtype=object),
+            "case_type": pd.Categorical(
+                columns["case_type"],
+                categories=[case_type.value for case_type in CaseType],
+            ),
+            "district": pd.Categorical(columns["district"]),
+            "is_company": np.asarray(columns["is_company"], dtype=bool),
+        }
+    )
+
+
+class DedupIndex:
+    """
+    Relevant cases with the date their (court, aktenzeichen) was first seen,
+    together with the source files they were read from.
+
+    The index is kept between runs, on S3 or on disk depending on
+    DEDUP_INDEX_BACKEND, so new day files can be deduplicated without reading
+    the old ones again.
+    """
+
+    VERSION = 2
+
+    def __init__(self, insolvency_type: InsolvencyType):
+        self.insolvency_type = insolvency_type
+
+        # Filename -> ETag of every source file that has been processed
+        self.processed = {}
+        self.table = make_case_table({column: [] for column in COLUMNS})
+        self.stats = {case_type: defaultdict(int) for case_type in CaseType}
+
+        self._seen = {case_type: set() for case_type in CaseType}
+        self._new_rows = {column: [] for column in COLUMNS}
+
+    @staticmethod
+    def file_path(insolvency_type: InsolvencyType) -> str:
+        return path.join(DEDUP_INDEX_DIR, f"dedup-{insolvency_type.value}.json.gz")
+
+    @staticmethod
+    def key(insolvency_type: InsolvencyType) -> str:
+        return f"{DEDUP_INDEX_PREFIX}/dedup-{insolvency_type.value}.json.gz"
+
+    @classmethod
+    def load(cls, insolvency_type: InsolvencyType) -> Optional["DedupIndex"]:
+        """
+        Returns the saved index, or None if there is none or it can't be read,
+        so it is rebuilt
+        """
+        try:
+            state = json.loads(gzip.decompress(cls._read(insolvency_type)))
+
+            if state.get("version") != cls.VERSION:
+                return None
+
+            index = cls(insolvency_type)
+            index.processed = dict(state["processed"])
+            columns = {column: state["table"][column] for column in COLUMNS}
+            columns["date"] = pd.to_datetime(columns["date"], format="%Y-%m-%d")
+            index.table = make_case_table(columns)
+
+            for case_type in CaseType:
+                index.stats[case_type].update(state["stats"][case_type.value])
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("Discarding unreadable dedup index: {}", e)
+            return None
+
+        for case_type in CaseType:
+            cases = index.table[index.table["case_type"] == case_type.value]
+            index._seen[case_type] = set(zip(cases["court"], cases["aktenzeichen"]))
+
+        return index
+
+    def save(self):
+        table = self.cases()
+        state = {
+            "version": self.VERSION,
+            "processed": self.processed,
+            "table": {
+                "date": table["date"].dt.strftime("%Y-%m-%d").tolist(),
+                **{
+                    column: plain_values(table[column])
+                    for column in COLUMNS
+                    if column != "date"
+                },
+            },
+            "stats": {
+                case_type.value: dict(self.stats[case_type]) for case_type in CaseType
+            },
+        }
+
+        # Higher levels take several times as long for a few percent less
+        data = gzip.compress(json.dumps(state).encode("utf-8"), compresslevel=6)
+
+        if DEDUP_INDEX_BACKEND == "s3":
+            get_client().put_object(
+                Bucket=bucket_name(BUCKET_DEDUP_INDEX_ENV),
+                Key=self.key(self.insolvency_type),
+                Body=data,
+                ACL="private",
+                ContentType="application/gzip",
+            )
+            return
+
+        file_path = self.file_path(self.insolvency_type)
+        os.makedirs(path.dirname(file_path), exist_ok=True)
+
+        tmp_path = file_path + ".tmp"
+        with open(tmp_path, "wb") as fp:
+            fp.write(data)
+        os.replace(tmp_path, file_path)
+
+    @classmethod
+    def _read(cls, insolvency_type: InsolvencyType) -> bytes:
+        """
+        Returns the saved index, raises FileNotFoundError if there is none
+        """
+        if DEDUP_INDEX_BACKEND == "s3":
+            from botocore.exceptions import ClientError
+
+            key = cls.key(insolvency_type)
+            try:
+                response = get_client().get_object(
+                    Bucket=bucket_name(BUCKET_DEDUP_INDEX_ENV), Key=key
+                )
+            except ClientError as e:
+                if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                    raise FileNotFoundError(key) from e
+                raise
+
+            return response["Body"].read()
+
+        with open(cls.file_path(insolvency_type), "rb") as fp:
+            return fp.read()
+
+    def new_source_objects(
+        self, source_objects: List[SourceObject]
+    ) -> Optional[List[SourceObject]]:
+        """
+        Returns the source files that still have to be processed, or None if the
+        index can't be extended incrementally because old files changed or new
+        files are older than processed ones.
+        """
+        etags = {
+            source_object.filename: source_object.etag
+            for source_object in source_objects
+        }
+
+        for filename, etag in self.processed.items():
+            if etags.get(filename) != etag:
+                logger.info("Source file {} was changed or removed", filename)
+                return None
+
+        new_objects = [
+            source_object
+            for source_object in source_objects
+            if source_object.filename not in self.processed
+        ]
+
+        if new_objects and self.processed:
+            first_new = min(source_object.filename for source_object in new_objects)
+            if first_new < max(self.processed):
+                logger.info("Source file {} predates processed files", first_new)
+                return None
+
+        return new_objects
+
+    def add_file(self, date, fil, source_object: SourceObject):
+        """
+        Adds the relevant and not yet seen cases of a projected source file
+        """
+        # Filter irrelevant and duplicate values
+        self._add_cases(date, fil, CaseType.ABWEISUNGMANGELSMASSE)
+        self._add_cases(date, fil, CaseType.SICHERUNGSMASSNAHMEN)
+        self._add_cases(date, fil, CaseType.VERFAHRENEROEFFNET)
+
+        self.processed[source_object.filename] = source_object.etag
+
+    def _add_cases(self, date, fil, case_type: CaseType):
+        stats = self.stats[case_type]
+        seen = self._seen[case_type]
+        rows = self._new_rows
+
+        for case in fil.get(case_type.value, []):
+            # Cases without any of the known keys aren't projected while decoding
+            if isinstance(case, dict):
+                case = project_case(case)
+
+            # Count total cases
+            stats["total_cases"] += 1
+
+            # Test if entry contains courtcase residences
+            if not case.has_residences:
+                stats["no_courtcase_residences"] += 1
+                continue
+
+            # Not in NRW
+            if case.district is None:
+                continue
+
+            unique_case_number = (case.court, case.aktenzeichen)
+
+            # Duplicate court case number
+            if unique_case_number in seen:
+                stats["nrw_duplicates"] += 1
+                continue
+
+            seen.add(unique_case_number)
+
+            # Add proceeding to the table
+            rows["date"].append(date)
+            rows["court"].append(case.court)
+            rows["aktenzeichen"].append(case.aktenzeichen)
+            rows["case_type"].append(case_type.value)
+            rows["district"].append(normalize.district(case.district))
+            rows["is_company"].append(case.is_company)
+
+    def cases(self) -> pd.DataFrame:
+        """
+        Returns the case table, sorted by date of first appearance
+        """
+        if self._new_rows["date"]:
+            table = pd.concat(
+                [self.table, make_case_table(self._new_rows)], ignore_index=True
+            )
+            # Categories of both parts differ, so the dtypes have to be restored
+            self.table = make_case_table({column: table[column] for column in COLUMNS})
+            self._new_rows = {column: [] for column in COLUMNS}
+
+        return self.table
@@ -0,0 +1,175 @@
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+from insolvenzen.utils.source import CaseType
+
+CASE_TYPES = list(CaseType)
+
+
+class CaseIndex:
+    """
+    Cumulative case counts by day, district, case type and company flag.
+
+    Built once from the case table returned by ``filter_data``, after which the
+    number of cases in any date window is a difference of two rows.
+    """
+
+    def __init__(self, cases: pd.DataFrame):
+        dates = cases["date"]
+
+        self.districts = list(cases["district"].cat.categories)
+        self.origin = dates.min().normalize() if len(cases) else pd.Timestamp(0)
+
+        days = (dates - self.origin).dt.days.to_numpy()
+        self.num_days = int(days.max()) + 1 if len(cases) else 0
+
+        counts = np.zeros(
+            (self.num_days, len(self.districts), len(CASE_TYPES), 2),
+            dtype=np.int32,
+        )
+        np.add.at(
+            counts,
+            (
+                days,
+                cases["district"].cat.codes.to_numpy(),
+                cases["case_type"].cat.codes.to_numpy(),
+                cases["is_company"].to_numpy(dtype=np.intp),
+            ),
+            1,
+        )
+
+        # Row of the first case per day, district and case type, in the order of
+        # the case table, which is sorted by date
+        self.first_rows = np.full(counts.shape[:3], len(cases), dtype=np.int64)
+        np.minimum.at(
+            self.first_rows,
+            (
+                days,
+                cases["district"].cat.codes.to_numpy(),
+                cases["case_type"].cat.codes.to_numpy(),
+            ),
+            np.arange(len(cases)),
+        )
+
+        # cumulative[i] holds the counts of all days before day i
+        self.cumulative = np.zeros((self.num_days + 1,) + counts.shape[1:], np.int32)
+        np.cumsum(counts, axis=0, out=self.cumulative[1:])
+
+        # Last day with at least one case, per case type
+        per_case_type = counts.sum(axis=(1, 3))
+        self._last_days = {}
+        for position, case_type in enumerate(CASE_TYPES):
+            (nonzero,) = np.nonzero(per_case_type[:, position])
+            if len(nonzero):
+                self._last_days[case_type] = int(nonzero[-1])
+
+    def _position(self, date) -> int:
+        """
+        Returns the row of ``cumulative`` that counts all cases up to and
+        including ``date``
+        """
+        offset = (pd.Timestamp(date).normalize() - self.origin).days + 1
+        return min(max(offset, 0), self.num_days)
+
+    def latest_date(self, case_type: CaseType) -> pd.Timestamp:
+        """
+        Returns the date of the most recent case of the given type
+        """
+        return self.origin + pd.Timedelta(days=self._last_days[case_type])
+
+    def window(self, start_date, end_date, case_type: CaseType) -> np.ndarray:
+        """
+        Returns counts by district and company flag for start_date < date <= end_date
+        """
+        position = CASE_TYPES.index(case_type)
+        return (
+            self.cumulative[self._position(end_date), :, position]
+            - self.cumulative[self._position(start_date), :, position]
+        )
+
+    def count(self, start_date, end_date, case_type: CaseType) -> int:
+        """
+        Counts the cases of the given type with start_date < date <= end_date
+        """
+        return int(self.window(start_date, end_date, case_type).sum())
+
+    def count_by_district(self, start_date, end_date, case_type: CaseType) -> dict:
+        """
+        Counts the cases of the given type with start_date < date <= end_date
+        per district, leaving out districts without cases
+        """
+        counts = self.window(start_date, end_date, case_type).sum(axis=1)
+        return {
+            district_name: int(count)
+            for district_name, count in zip(self.districts, counts)
+            if count
+        }
+
+    def districts_by_first_case(
+        self, start_date, end_date, case_type: CaseType
+    ) -> list:
+        """
+        Returns the districts with cases of the given type with
+        start_date < date <= end_date, in the order of their first case
+        """
+        position = CASE_TYPES.index(case_type)
+        start = self._position(start_date)
+        end = self._position(end_date)
+
+        # Cumulative counts per district, regardless of the company flag
+        cumulative = self.cumulative[:, :, position].sum(axis=2)
+
+        first_cases = []
+        for district, district_name in enumerate(self.districts):
+            column = cumulative[:, district]
+            if column[end] == column[start]:
+                continue
+
+            # cumulative[day + 1] is the first row that includes the first case
+            day = int(np.searchsorted(column, column[start] + 1)) - 1
+            first_cases.append(
+                (self.first_rows[day, district, position], district_name)
+            )
+
+        return [district_name for _, district_name in sorted(first_cases)]
+
+    def count_by_iso_week(self, case_type: CaseType, *, by_company: bool = False):
+        """
+        Counts the cases of the given type per ISO week, in chronological order.
+
+        Returns a dict keyed by ``(year, week)``, or by ``(year, week, is_company)``
+        with ``by_company``. Weeks without cases are left out.
+        """
+        if not self.num_days:
+            return {}
+
+        first_monday = self.origin - pd.Timedelta(days=self.origin.weekday())
+        num_weeks = (self.num_days + self.origin.weekday()) // 7 + 1
+        mondays = [first_monday + dt.timedelta(weeks=i) for i in range(num_weeks)]
+
+        # Rows of cumulative at the start of each week and after the last one
+        positions = [
+            self._position(monday - dt.timedelta(days=1)) for monday in mondays
+        ]
+        positions.append(self._position(mondays[-1] + dt.timedelta(days=6)))
+
+        position = CASE_TYPES.index(case_type)
+        per_week = np.diff(self.cumulative[positions, :, position], axis=0).sum(axis=1)
+
+        counts = {}
+        for monday, (private_count, company_count) in zip(mondays, per_week):
+            year, week, _ = monday.isocalendar()
+
+            if by_company:
+                for is_company, count in (
+                    (False, private_count),
+                    (True, company_count),
+                ):
+                    if count:
+                        counts[(year, week, is_company)] = int(count)
+            elif private_count + company_count:
+                counts[(year, week)] = int(private_count + company_count)
+
+        return counts
@@ -1,43 +1,33 @@
-import re
-from datetime import datetime, time
-from functools import lru_cache
 import datetime as dt
 from collections import defaultdict
 
-import requests
 import pandas as pd
-import pytz
-import sentry_sdk
 
-from insolvenzen.utils.storage import upload_dataframe
+from insolvenzen.utils.storage import PublishQueue
 from insolvenzen.utils.source import (
     InsolvencyType,
     CaseType,
 )
 from insolvenzen.data.inhabitants import inhabitants
-from insolvenzen.data import normalize
-from insolvenzen.scrapers.common import filter_data, in_nrw, signed
+from insolvenzen.scrapers.scheduler import consumes
+from insolvenzen.scrapers.common import (
+    case_index,
+    repeated_sum,
+    signed,
+)
 
 
 def history():
-    cases, stats = filter_data(InsolvencyType.PRIVATE)
-    proceedings = cases[CaseType.VERFAHRENEROEFFNET]
-
-    # Bin proceedings by year
-    by_year = defaultdict(list)
-
-    for proceeding in proceedings:
-        by_year[proceeding["date"].year].append(proceeding)
+    index = case_index(InsolvencyType.PRIVATE)
 
     # Bin proceedings by year and week
-    by_year_and_week = defaultdict(lambda: defaultdict(list))
-    by_year_and_week_count = defaultdict(lambda: defaultdict(int))
+    # Note: isocalendar week behaves weirdly between years
+    by_year_and_week_count = defaultdict(dict)
 
-    for proceeding in proceedings:
-        # Note: isocalendar week behaves weirdly between years
-        calendar = proceeding["date"].isocalendar()
-        by_year_and_week[calendar[0]][calendar[1]].append(proceeding)
-        by_year_and_week_count[calendar[0]][calendar[1]] += 1
+    for (year, week), count in index.count_by_iso_week(
+        CaseType.VERFAHRENEROEFFNET
+    ).items():
+        by_year_and_week_count[year][week] = count
 
     # Construct dataframe
     df_by_week = pd.concat(
@@ -54,31 +44,27 @@ def history():
 
 
 def districts():
-    cases, stats = filter_data(InsolvencyType.PRIVATE)
-    proceedings = cases[CaseType.VERFAHRENEROEFFNET]
+    index = case_index(InsolvencyType.PRIVATE)
 
     # Filter for recent proceedings
-    latest_data = max(p["date"] for p in proceedings)
+    latest_data = index.latest_date(CaseType.VERFAHRENEROEFFNET)
     start_date = latest_data - dt.timedelta(days=30)
-    last_30_days = [p for p in proceedings if p["date"] > start_date]
-
-    # Group by district name
-    by_district_name = defaultdict(int)
+    counts = index.count_by_district(
+        start_date, latest_data, CaseType.VERFAHRENEROEFFNET
+    )
 
-    for proceeding in last_30_days:
-        court = next(
-            residence
-            for residence in proceeding["courtcase-residences"]
-            if in_nrw(residence)
-        )
+    # Group by district name, in the order of their first recent proceeding
+    by_district_name = {}
 
-        district_name = court["geolocation-street"]["street-gemeinde"][
-            "gemeinde-kreis"
-        ]["kreis-name"]
-        district_name = normalize.district(district_name)
+    for district_name in index.districts_by_first_case(
+        start_date, latest_data, CaseType.VERFAHRENEROEFFNET
+    ):
+        count = counts[district_name]
         num_inhabitants = inhabitants[district_name]
 
-        by_district_name[district_name] += 1 / num_inhabitants * 100_000
+        by_district_name[district_name] = repeated_sum(
+            1 / num_inhabitants * 100_000, count
+        )
 
     # Fill missing districts
     for district_name in inhabitants.keys():
@@ -97,21 +83,18 @@ def districts():
     return df
 
 
-@lru_cache
 def current():
-    cases, stats = filter_data(InsolvencyType.PRIVATE)
-    proceedings = cases[CaseType.VERFAHRENEROEFFNET]
+    index = case_index(InsolvencyType.PRIVATE)
+    case_type = CaseType.VERFAHRENEROEFFNET
 
     # Filter for recent proceedings
-    latest_data = max(p["date"] for p in proceedings)
+    latest_data = index.latest_date(case_type)
 
     date_7_days_ago = latest_data - dt.timedelta(days=7)
     date_14_days_ago = latest_data - dt.timedelta(days=14)
 
-    last_7_days = len([p for p in proceedings if p["date"] > date_7_days_ago])
-    the_7_days_before = len(
-        [p for p in proceedings if date_7_days_ago >= p["date"] > date_14_days_ago]
-    )
+    last_7_days = index.count(date_7_days_ago, latest_data, case_type)
+    the_7_days_before = index.count(date_14_days_ago, date_7_days_ago, case_type)
     try:
         percent_change = f"{signed(round((last_7_days - the_7_days_before) / the_7_days_before * 100))}%"
     except ZeroDivisionError:
@@ -128,15 +111,20 @@ def current():
     return df
 
 
+@consumes(InsolvencyType.PRIVATE)
 def write_data_private():
+    queue = PublishQueue()
+
     df = history()
-    upload_dataframe(df, "private_by_year_by_week.csv")
+    queue.submit(df, "private_by_year_by_week.csv", gzip=True)
 
     df = districts()
-    upload_dataframe(df, "private_by_district_name.csv")
+    queue.submit(df, "private_by_district_name.csv")
 
     df = current()
-    upload_dataframe(df, "private_current.csv")
+    queue.submit(df, "private_current.csv")
+
+    queue.publish()
 
 
 # If the file is executed directly, print cleaned data
@@ -1,23 +1,16 @@
-import re
-from datetime import datetime, time
-from functools import lru_cache
 import datetime as dt
 from collections import defaultdict
 
-import requests
 import pandas as pd
-import pytz
-import sentry_sdk
 
-from insolvenzen.utils.storage import upload_dataframe
+from insolvenzen.utils.storage import PublishQueue
 from insolvenzen.utils.source import (
     InsolvencyType,
     CaseType,
 )
 from insolvenzen.data.inhabitants import inhabitants
-from insolvenzen.data import normalize
-from insolvenzen.scrapers.common import filter_data, in_nrw, signed
-
+from insolvenzen.scrapers.scheduler import consumes
+from insolvenzen.scrapers.common import case_index, repeated_sum, signed
 
 CASE_TYPE_HEADERS = {
     CaseType.VERFAHRENEROEFFNET: "Insolvenzverfahren",
@@ -27,14 +20,7 @@ CASE_TYPE_HEADERS = {
 
 
 def history(case_type):
-    cases, stats = filter_data(InsolvencyType.REGULAR)
-    cases = cases[case_type]
-
-    # Bin proceedings by year
-    by_year = defaultdict(list)
-
-    for case in cases:
-        by_year[case["date"].year].append(case)
+    index = case_index(InsolvencyType.REGULAR)
 
     # Bin proceedings by year and week
     by_week_count = defaultdict(lambda: defaultdict(int))
@@ -44,22 +30,18 @@ def history(case_type):
     year_today = calendar_today[0]
     week_today = calendar_today[1]
 
-    for case in cases:
-        # Note: isocalendar week behaves weirdly between years
-        calendar = case["date"].isocalendar()
-        year = calendar[0]
-        week = calendar[1]
+    # Note: isocalendar week behaves weirdly between years
+    counts = index.count_by_iso_week(case_type, by_company=True)
 
+    for (year, week, is_company), count in counts.items():
         # ISO week as string for datawrapper
         if year == year_today or year == year_today - 1 and week >= week_today:
-            subtitle = (
-                "Unternehmen" if case["courtcase-is-company"] else "Selbstständige"
-            )
+            subtitle = "Unternehmen" if is_company else "Selbstständige"
             by_week_count[f"{year}W{week}"][
                 f"{CASE_TYPE_HEADERS[case_type]} ({subtitle})"
-            ] += 1
+            ] += count
 
-        by_year_and_week_count[year][week] += 1
+        by_year_and_week_count[year][week] += count
 
     # Construct dataframes
     df_week_year = pd.concat(
@@ -83,32 +65,25 @@ def history(case_type):
 
 
 def districts(case_type):
-    cases, stats = filter_data(InsolvencyType.REGULAR)
-    cases = cases[case_type]
+    index = case_index(InsolvencyType.REGULAR)
 
     # Filter for recent cases
-    latest_data = max(p["date"] for p in cases)
+    latest_data = index.latest_date(case_type)
     start_date = latest_data - dt.timedelta(days=30)
-    last_30_days = [p for p in cases if p["date"] > start_date]
+    last_30_days = index.count_by_district(start_date, latest_data, case_type)
 
     # Group by district name
-    by_district_name = defaultdict(lambda: defaultdict(int))
-
-    for case in last_30_days:
-        court = next(
-            residence for residence in case["courtcase-residences"] if in_nrw(residence)
-        )
+    by_district_name = {}
 
-        district_name = court["geolocation-street"]["street-gemeinde"][
-            "gemeinde-kreis"
-        ]["kreis-name"]
-        district_name = normalize.district(district_name)
+    for district_name, count in last_30_days.items():
         num_inhabitants = inhabitants[district_name]
 
-        by_district_name[district_name][CASE_TYPE_HEADERS[case_type]] += 1
-        by_district_name[district_name][
-            f"{CASE_TYPE_HEADERS[case_type]} pro 100.000 Einwohner"
-        ] += (1 / num_inhabitants * 100_000)
+        by_district_name[district_name] = {
+            CASE_TYPE_HEADERS[case_type]: count,
+            f"{CASE_TYPE_HEADERS[case_type]} pro 100.000 Einwohner": repeated_sum(
+                1 / num_inhabitants * 100_000, count
+            ),
+        }
 
     # Fill missing districts
     for district_name in inhabitants.keys():
@@ -132,21 +107,17 @@ def districts(case_type):
     return df
 
 
-@lru_cache
 def current(case_type):
-    cases, stats = filter_data(InsolvencyType.REGULAR)
-    cases = cases[case_type]
+    index = case_index(InsolvencyType.REGULAR)
 
     # Filter for recent proceedings
-    latest_data = max(p["date"] for p in cases)
+    latest_data = index.latest_date(case_type)
 
     date_7_days_ago = latest_data - dt.timedelta(days=7)
     date_14_days_ago = latest_data - dt.timedelta(days=14)
 
-    last_7_days = len([p for p in cases if p["date"] > date_7_days_ago])
-    the_7_days_before = len(
-        [p for p in cases if date_7_days_ago >= p["date"] > date_14_days_ago]
-    )
+    last_7_days = index.count(date_7_days_ago, latest_data, case_type)
+    the_7_days_before = index.count(date_14_days_ago, date_7_days_ago, case_type)
     try:
         percent_change = f"{signed(round((last_7_days - the_7_days_before) / the_7_days_before * 100))}%"
     except ZeroDivisionError:
@@ -163,37 +134,45 @@ def current(case_type):
     return df
 
 
+@consumes(InsolvencyType.REGULAR)
 def write_data_regular():
+    queue = PublishQueue()
     districtses = []
     histories_by_week = []
     currents = []
 
     for case_type in CaseType:
         df = districts(case_type)
-        upload_dataframe(df, f"regular_by_district_name_{case_type.value}.csv")
+        queue.submit(df, f"regular_by_district_name_{case_type.value}.csv")
 
         districtses.append(df)
 
         df_week, df_year_week = history(case_type)
-        upload_dataframe(df_year_week, f"regular_by_year_by_week_{case_type.value}.csv")
-        upload_dataframe(df_week, f"regular_by_week_{case_type.value}.csv")
+        queue.submit(
+            df_year_week,
+            f"regular_by_year_by_week_{case_type.value}.csv",
+            gzip=True,
+        )
+        queue.submit(df_week, f"regular_by_week_{case_type.value}.csv", gzip=True)
 
         histories_by_week.append(df_week)
 
         df = current(case_type)
-        upload_dataframe(df, f"regular_current_{case_type.value}.csv")
+        queue.submit(df, f"regular_current_{case_type.value}.csv")
         currents.append(df)
 
     df_districtses = pd.concat(districtses, axis=1)
     df_districtses.index.name = "Name"
 
-    upload_dataframe(df_districtses, f"regular_by_district_name_merged.csv")
+    queue.submit(df_districtses, f"regular_by_district_name_merged.csv")
 
     df_histories_by_week = pd.concat(histories_by_week, axis=1)
-    upload_dataframe(df_histories_by_week, f"regular_by_week_merged.csv")
+    queue.submit(df_histories_by_week, f"regular_by_week_merged.csv", gzip=True)
 
     df_currents = pd.concat(currents)
-    upload_dataframe(df_currents, f"regular_current_merged.csv")
+    queue.submit(df_currents, f"regular_current_merged.csv")
+
+    queue.publish()
 
 
 # If the file is executed directly, print cleaned data
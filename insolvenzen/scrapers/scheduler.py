@@ -0,0 +1,146 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from loguru import logger
+import sentry_sdk
+
+from insolvenzen.scrapers.common import case_index, clear_caches, release
+from insolvenzen.utils.metrics import Collector, stage
+from insolvenzen.utils.profiling import profile
+from insolvenzen.utils.source import InsolvencyType
+
+
+def consumes(*datasets: InsolvencyType):
+    """
+    Declares the filtered case datasets a scraper reads, so the scheduler can
+    load them before it starts and free them after their last consumer is done.
+
+    Usage:
+
+        @consumes(InsolvencyType.PRIVATE)
+        def write_data_private():
+            ...
+    """
+
+    def decorator(scraper: Callable) -> Callable:
+        scraper.consumes = frozenset(datasets)
+        return scraper
+
+    return decorator
+
+
+def datasets_of(scraper: Callable) -> frozenset:
+    return getattr(scraper, "consumes", frozenset())
+
+
+class ScraperResult(NamedTuple):
+    name: str
+    error: Optional[Exception] = None
+
+
+def run_scrapers(
+    scrapers: List[Callable], *, collector: Optional[Collector] = None
+) -> List[ScraperResult]:
+    """
+    Runs scrapers concurrently, each as soon as the datasets it consumes are
+    loaded. Datasets are loaded in parallel and released once all of their
+    consumers have finished.
+
+    Errors are logged and sent to Sentry per scraper, so one failing scraper
+    doesn't stop the others. Scrapers whose datasets failed to load fail with
+    the same error. Returns one result per scraper, in the given order.
+
+    Metrics of every dataset and scraper are recorded in ``collector``.
+    """
+    if collector is None:
+        collector = Collector()
+
+    consumers = {}
+    for scraper in scrapers:
+        for dataset in datasets_of(scraper):
+            consumers[dataset] = consumers.get(dataset, 0) + 1
+
+    hub = sentry_sdk.Hub.current
+    waiting = list(scrapers)
+    loaded: Dict[InsolvencyType, Optional[Exception]] = {}
+    results: Dict[Callable, ScraperResult] = {}
+
+    def finish(scraper, error):
+        results[scraper] = ScraperResult(scraper.__name__, error)
+
+        for dataset in datasets_of(scraper):
+            consumers[dataset] -= 1
+            if consumers[dataset] == 0:
+                logger.debug("Releasing {} dataset", dataset.value)
+                release(dataset)
+
+    try:
+        with ThreadPoolExecutor(
+            max_workers=max(len(scrapers) + len(consumers), 1)
+        ) as executor:
+            running = {
+                executor.submit(
+                    _run, hub, collector, "dataset", dataset.value, case_index, dataset
+                ): dataset
+                for dataset in consumers
+            }
+
+            while waiting or running:
+                # Start every scraper whose datasets are ready
+                for scraper in list(waiting):
+                    datasets = datasets_of(scraper)
+                    if not all(dataset in loaded for dataset in datasets):
+                        continue
+
+                    waiting.remove(scraper)
+                    errors = [loaded[d] for d in datasets if loaded[d] is not None]
+
+                    if errors:
+                        logger.error("Skipping {}, data is missing", scraper.__name__)
+                        finish(scraper, errors[0])
+                    else:
+                        future = executor.submit(
+                            _run, hub, collector, "scraper", scraper.__name__, scraper
+                        )
+                        running[future] = scraper
+
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = running.pop(future)
+                    if isinstance(item, InsolvencyType):
+                        loaded[item] = future.result()
+                    else:
+                        finish(item, future.result())
+    finally:
+        # Don't keep data around for the next invocation of a warm Lambda
+        clear_caches()
+
+    return [results[scraper] for scraper in scrapers]
+
+
+def _run(
+    hub, collector: Collector, tag: str, name: str, fn: Callable, *args
+) -> Optional[Exception]:
+    """
+    Calls ``fn`` with its own Sentry scope and metrics record and returns the
+    exception it raised. Time not spent in other stages counts as aggregation.
+    """
+    with sentry_sdk.Hub(hub) as thread_hub, collector.record(tag + "s", name):
+        with thread_hub.configure_scope() as scope:
+            scope.set_tag(tag, name)
+            try:
+                with stage("aggregate"), profile(f"{tag}-{name}"):
+                    fn(*args)
+                now = datetime.datetime.now()
+                verb = "Loaded" if tag == "dataset" else "Updated"
+                logger.info(f"{verb} {name} at {now}")
+            except Exception as e:
+                # Catch and send error to Sentry manually so we can continue
+                # running other scrapers if one fails
+                logger.exception(f"{tag.capitalize()} {name} failed with {e}")
+                thread_hub.capture_exception(e)
+                return e
@@ -1,7 +1,12 @@
+from os import path
+from typing import Optional
+
 from loguru import logger
 from insolvenzen.twentyone.exporter import export_cases
-from insolvenzen.twentyone.extractor import extract_features
+from insolvenzen.twentyone.extractor import extract_features_batch
 from insolvenzen.twentyone.loader import get_cases, list_files
+from insolvenzen.twentyone.store import add_to_store
+from insolvenzen.utils.profiling import profile
 
 
 def run():
@@ -9,26 +14,26 @@ def run():
         handle_file(filename)
 
 
-def run_concurrent():
+def run_concurrent(max_workers: Optional[int] = None):
     from concurrent.futures import ProcessPoolExecutor
 
-    executor = ProcessPoolExecutor()
-    futures = []
-    for filename in list_files():
-        future = executor.submit(handle_file, filename)
-        futures.append(future)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        for filename in list_files():
+            future = executor.submit(handle_file, filename)
+            futures.append(future)
 
-    for future in futures:
-        future.result()
+        for future in futures:
+            future.result()
 
 
 def handle_file(filename: str):
     logger.info("Handling file {}", filename)
-    cases = []
-    for case in get_cases(filename):
-        cases.append(extract_features(case))
 
-    export_cases(cases, filename)
+    with profile(path.basename(filename)):
+        features = extract_features_batch(get_cases(filename))
+        export_cases(features, filename)
+        add_to_store(filename, features)
 
 
 def new_file_handler(event: dict, context: dict):
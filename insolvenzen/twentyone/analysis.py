@@ -1,58 +1,439 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
 from pathlib import Path
 from os import environ
+import pickle
+from typing import Dict, Iterable, List, Optional, Tuple
 
+from loguru import logger
 import pandas as pd
 
+from insolvenzen.twentyone.exporter import (
+    CATEGORICAL_COLUMNS,
+    COLUMNAR_FORMATS,
+    export_formats,
+)
+from insolvenzen.twentyone.store import CaseStore, store_path
+from insolvenzen.utils.s3 import MAX_WORKERS
 
-def load_data():
-    if environ.get("USE_LOCAL_FILES"):
-        paths = Path("extracted").rglob("*.csv")
-        df_parts = []
+# Columns used by run
+ANALYSIS_COLUMNS = [
+    "date_of_publication",
+    "description_hash",
+    "federal_state",
+    "kind",
+    "type_of_proceeding",
+]
 
-        for path in sorted(paths):
-            # if path.parts[-1] < "2021-08-11T14-54-35.jsonl.csv":
-            #     continue
+# Cases run looks at, ik = privat, in = geschaeftlich
+ANALYSIS_FEDERAL_STATES = ["Nordrhein-Westfalen", "nw"]
+ANALYSIS_KINDS = ["ik"]
 
-            # test = [
-            #     "2021-03-14T04-06-39.jsonl.csv",
-            #     "2021-10-20T00-26-46.jsonl.csv",
-            # ]
-            # if path.parts[-1] not in test:
-            #     continue
+CACHE_DIR = environ.get("ANALYSIS_CACHE_DIR", str(Path("extracted") / ".cache"))
 
-            print("Reading for analysis:", path)
+# Column with the file each cached row was read from
+SOURCE_COLUMN = "_source"
 
-            with open(path, "r", encoding="utf-8") as fp:
-                df_part = pd.read_csv(fp, delimiter=",", dtype=str)
-                df_part["date_of_publication"] = pd.to_datetime(
-                    df_part["date_of_publication"],
-                    format="%Y-%m-%d",
-                )
-                df_part["date_of_proceeding"] = pd.to_datetime(
-                    df_part["date_of_proceeding"],
-                    format="%Y-%m-%d",
-                    errors="coerce",
-                )
-                df_part["date_of_birth"] = pd.to_datetime(
-                    df_part["date_of_birth"],
-                    format="%Y-%m-%d",
-                    errors="coerce",
-                )
-                df_parts.append(df_part)
+# Size and modification time of a file, in nanoseconds
+Stamp = Tuple[int, int]
 
-            # if df is None:
-            #     df = df_part
-            # else:
-            #     df = df.append(df_part, ignore_index=True)
 
-        df = pd.concat(df_parts, ignore_index=True)
+def load_data(
+    columns: Optional[List[str]] = None,
+    months: Optional[Iterable[str]] = None,
+    federal_states: Optional[Iterable[str]] = None,
+    kinds: Optional[Iterable[str]] = None,
+    cache: bool = True,
+):
+    """
+    Loads the extracted cases, optionally only ``columns``, the months of
+    publication in ``months``, given like ``"2021-08"``, and the cases with
+    a federal state in ``federal_states`` and a kind in ``kinds``.
 
-    else:
+    Files are read in parallel, and only the requested columns and rows are
+    read. With ``cache``, the cases are kept in a consolidated cache for these
+    columns and filters, keyed by the extracted files and their modification
+    times, and only new or changed files are read. Without it, only the
+    partitions of ``months`` are read if EXPORT_FORMAT includes a columnar
+    format.
+    """
+    if not environ.get("USE_LOCAL_FILES"):
         raise NotImplementedError("Remote data not yet implemented")
 
+    columnar = [name for name in export_formats() if name in COLUMNAR_FORMATS]
+    export_format = columnar[0] if columnar else "csv"
+    months = None if months is None else set(months)
+    filters = {
+        column: set(values)
+        for column, values in (("federal_state", federal_states), ("kind", kinds))
+        if values is not None
+    }
+
+    # The columns filtered on have to be read, even if they aren't returned
+    read_columns = columns and list(
+        dict.fromkeys(
+            [
+                *columns,
+                *filters,
+                *(["date_of_publication"] if months is not None else []),
+            ]
+        )
+    )
+
+    if cache:
+        df = load_cached(export_format, read_columns, filters)
+    else:
+        paths = extracted_files(
+            export_format, months if export_format in COLUMNAR_FORMATS else None
+        )
+        df = concat(
+            export_format,
+            read_files(export_format, paths, read_columns, filters),
+        )
+
+    if months is not None:
+        selected = df["date_of_publication"].dt.strftime("%Y-%m").isin(months)
+        df = df[selected].reset_index(drop=True)
+
+    if columns is not None:
+        df = df[[column for column in df.columns if column in columns]]
+
+    return df
+
+
+def extracted_files(
+    export_format: str, months: Optional[Iterable[str]] = None
+) -> List[Path]:
+    """
+    Lists the extracted files in ``export_format`` in sorted order, for
+    columnar formats only those in the partitions of ``months``
+    """
+    if export_format not in COLUMNAR_FORMATS:
+        return sorted(Path("extracted").rglob("*.csv"))
+
+    paths = []
+    for partition in sorted((Path("extracted") / export_format).glob("month=*")):
+        if months is not None and partition.name[len("month=") :] not in months:
+            continue
+        paths.extend(sorted(partition.glob(f"*.{export_format}")))
+
+    return paths
+
+
+def read_file(
+    export_format: str,
+    path: Path,
+    columns: Optional[List[str]] = None,
+    filters: Optional[Dict[str, set]] = None,
+) -> pd.DataFrame:
+    """
+    Reads ``columns`` of an extracted file, only the rows matching
+    ``filters`` if given
+    """
+    logger.info("Reading for analysis: {}", path)
+
+    if export_format == "parquet":
+        # Row groups without matching values are skipped by pyarrow
+        return pd.read_parquet(
+            path,
+            columns=columns,
+            filters=(
+                [(column, "in", list(values)) for column, values in filters.items()]
+                if filters
+                else None
+            ),
+        )
+
+    if export_format == "feather":
+        df = pd.read_feather(path, columns=columns)
+    else:
+        with open(path, "r", encoding="utf-8") as fp:
+            df = pd.read_csv(
+                fp,
+                delimiter=",",
+                dtype=str,
+                usecols=columns and (lambda column: column in columns),
+            )
+
+    # Rows are dropped before dates are parsed and the files are concatenated
+    return parse_dates(filter_rows(df, filters))
+
+
+def read_files(
+    export_format: str,
+    paths: List[Path],
+    columns: Optional[List[str]] = None,
+    filters: Optional[Dict[str, set]] = None,
+) -> List[pd.DataFrame]:
+    """
+    Reads extracted files in parallel, in the order of ``paths``
+    """
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        return list(
+            executor.map(
+                lambda path: read_file(export_format, path, columns, filters), paths
+            )
+        )
+
+
+def concat(export_format: str, df_parts: List[pd.DataFrame]) -> pd.DataFrame:
+    df = pd.concat(df_parts, ignore_index=True)
+
+    if export_format in COLUMNAR_FORMATS:
+        # Categories differ between files, which makes concat fall back to objects
+        for column in CATEGORICAL_COLUMNS:
+            if column in df:
+                df[column] = df[column].astype("category")
+
     return df
 
 
+def filter_rows(df: pd.DataFrame, filters: Optional[Dict[str, set]]) -> pd.DataFrame:
+    if not filters:
+        return df
+
+    selected = pd.Series(True, index=df.index)
+    for column, values in filters.items():
+        selected &= df[column].isin(values)
+
+    return df[selected].reset_index(drop=True)
+
+
+class AnalysisCache:
+    """
+    The ``columns`` of the extracted cases in ``export_format`` matching
+    ``filters``, with the size and modification time of the files they were
+    read from, kept on disk between analyses
+    """
+
+    VERSION = 2
+
+    def __init__(
+        self,
+        export_format: str,
+        columns: Optional[List[str]] = None,
+        filters: Optional[Dict[str, set]] = None,
+    ):
+        self.export_format = export_format
+        self.columns = columns
+        self.filters = filters
+
+        # Path -> stamp of every file in the cache
+        self.files: Dict[str, Stamp] = {}
+        self.table: Optional[pd.DataFrame] = None
+
+    @property
+    def file_path(self) -> str:
+        # Every projection gets its own cache
+        projection = json.dumps(
+            [
+                self.columns and sorted(self.columns),
+                {
+                    column: sorted(values)
+                    for column, values in (self.filters or {}).items()
+                },
+            ],
+            sort_keys=True,
+        )
+        digest = hashlib.sha256(projection.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(CACHE_DIR, f"analysis-{self.export_format}-{digest}.pickle")
+
+    def load(self):
+        try:
+            with open(self.file_path, "rb") as fp:
+                state = pickle.load(fp)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning("Discarding unreadable analysis cache: {}", e)
+            return
+
+        if state.get("version") != self.VERSION:
+            return
+
+        self.files = state["files"]
+        self.table = state["table"]
+
+    def save(self):
+        state = {
+            "version": self.VERSION,
+            "files": self.files,
+            "table": self.table,
+        }
+
+        os.makedirs(CACHE_DIR, exist_ok=True)
+
+        tmp_path = self.file_path + ".tmp"
+        with open(tmp_path, "wb") as fp:
+            pickle.dump(state, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.file_path)
+
+    def update(self, paths: List[Path]) -> bool:
+        """
+        Reads the files in ``paths`` that are new or changed and drops the
+        rows of files that were changed or removed. Returns whether the cache
+        changed.
+        """
+        stamps = {}
+        for path in paths:
+            stat = path.stat()
+            stamps[str(path)] = (stat.st_size, stat.st_mtime_ns)
+
+        if stamps == self.files and self.table is not None:
+            return False
+
+        unchanged = {
+            name for name, stamp in stamps.items() if self.files.get(name) == stamp
+        }
+        changed = [path for path in paths if str(path) not in unchanged]
+
+        df_parts = []
+        if self.table is not None:
+            df_parts.append(self.table[self.table[SOURCE_COLUMN].isin(unchanged)])
+
+        for path, df_part in zip(
+            changed,
+            read_files(self.export_format, changed, self.columns, self.filters),
+        ):
+            df_parts.append(df_part.assign(**{SOURCE_COLUMN: str(path)}))
+
+        df = concat(self.export_format, df_parts)
+
+        # Rows are kept in the order of the files, like reading all of them
+        df[SOURCE_COLUMN] = pd.Categorical(
+            df[SOURCE_COLUMN], categories=list(stamps), ordered=True
+        )
+        self.table = df.sort_values(SOURCE_COLUMN, kind="stable", ignore_index=True)
+        self.files = stamps
+        return True
+
+
+def load_cached(
+    export_format: str,
+    columns: Optional[List[str]] = None,
+    filters: Optional[Dict[str, set]] = None,
+) -> pd.DataFrame:
+    """
+    Returns the ``columns`` of the extracted cases in ``export_format``
+    matching ``filters``, reading only the files that aren't in the analysis
+    cache yet
+    """
+    analysis_cache = AnalysisCache(export_format, columns, filters)
+    print("Reading for analysis:", analysis_cache.file_path)
+    analysis_cache.load()
+
+    if analysis_cache.update(extracted_files(export_format)):
+        analysis_cache.save()
+
+    return analysis_cache.table.drop(columns=SOURCE_COLUMN)
+
+
+def parse_dates(df: pd.DataFrame) -> pd.DataFrame:
+    if "date_of_publication" in df:
+        df["date_of_publication"] = pd.to_datetime(
+            df["date_of_publication"],
+            format="%Y-%m-%d",
+        )
+    if "date_of_proceeding" in df:
+        df["date_of_proceeding"] = pd.to_datetime(
+            df["date_of_proceeding"],
+            format="%Y-%m-%d",
+            errors="coerce",
+        )
+    if "date_of_birth" in df:
+        df["date_of_birth"] = pd.to_datetime(
+            df["date_of_birth"],
+            format="%Y-%m-%d",
+            errors="coerce",
+        )
+    return df
+
+
+def load_deduplicated(
+    columns: Optional[List[str]] = None,
+    federal_states: Optional[Iterable[str]] = None,
+    kinds: Optional[Iterable[str]] = None,
+):
+    """
+    Returns one row per description hash, with the number of times it was
+    seen in ``seen``, optionally only those with a federal state in
+    ``federal_states`` and a kind in ``kinds``.
+
+    The rows are read from the case store if handle_file kept one, otherwise
+    they are grouped from all extracted files. Extracted CSVs that are
+    missing from the store are added first. If the store can't be completed,
+    because only columnar files were exported, the files are grouped as well.
+    """
+    filters = {
+        column: list(values)
+        for column, values in (("federal_state", federal_states), ("kind", kinds))
+        if values is not None
+    }
+    file_path = store_path()
+
+    if file_path and Path(file_path).exists():
+        print("Reading for analysis:", file_path)
+
+        with CaseStore(file_path) as store:
+            complete = complete_store(store)
+            if complete:
+                df = pd.DataFrame.from_records(list(store.cases(filters)))
+
+        if complete:
+            if columns is not None:
+                df = df.reindex(columns=[*columns, "seen"])
+
+            return parse_dates(df)
+
+    if columns is not None and "description_hash" not in columns:
+        columns = [*columns, "description_hash"]
+
+    # Rows are filtered before they are grouped
+    df = load_data(columns, federal_states=federal_states, kinds=kinds)
+    grouped = df.groupby("description_hash", as_index=False)
+    seen = grouped.size()
+    df = grouped.first()
+    df["seen"] = seen["size"].values
+    return df
+
+
+def complete_store(store: CaseStore) -> bool:
+    """
+    Adds the extracted CSVs that aren't in the case store yet, e.g. because
+    they were extracted before the store was kept. Returns whether the store
+    covers all extracted files.
+    """
+    stored = set(store.files())
+    base_dir = Path("extracted")
+
+    for path in extracted_files("csv"):
+        filename = path.relative_to(base_dir).as_posix()[: -len(".csv")]
+        if filename in stored:
+            continue
+
+        logger.info("Adding {} to the case store", filename)
+
+        # Missing values are read as empty strings, which the store skips
+        with open(path, "r", encoding="utf-8") as fp:
+            df = pd.read_csv(fp, delimiter=",", dtype=str, keep_default_na=False)
+        store.add(filename, {column: df[column].tolist() for column in df.columns})
+        stored.add(filename)
+
+    stored_names = {os.path.basename(filename) for filename in stored}
+    for export_format in COLUMNAR_FORMATS:
+        for path in extracted_files(export_format):
+            if path.stem not in stored_names:
+                logger.warning(
+                    "{} is missing from the case store, grouping extracted files",
+                    path.stem,
+                )
+                return False
+
+    return True
+
+
 def run():
 
     # Print dataframe sample and info
@@ -60,17 +441,14 @@ def run():
     pd.set_option("display.width", 1000)
     pd.set_option("display.max_rows", 200)
 
-    df = load_data()
-
-    df = df[df["federal_state"].isin(["Nordrhein-Westfalen", "nw"])]
-
-    # ik = privat, in = geschaeftlich
-    df = df[df["kind"] == "ik"]
+    df = load_deduplicated(
+        ANALYSIS_COLUMNS,
+        federal_states=ANALYSIS_FEDERAL_STATES,
+        kinds=ANALYSIS_KINDS,
+    )
 
     # print(df)
-    print("All:", len(df))
-
-    df = df.groupby("description_hash", as_index=False).first()
+    print("All:", df["seen"].sum())
     print("Fingerprinted:", len(df))
 
     # print(
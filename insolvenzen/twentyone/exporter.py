@@ -1,23 +1,79 @@
+from importlib.util import find_spec
+from io import BytesIO
 from loguru import logger
+from insolvenzen.utils.s3 import bucket_name, get_client
 from insolvenzen.utils.storage import upload_dataframe
-from typing import Dict, List
+from typing import TYPE_CHECKING, Dict, List, Union
 from os import path, environ, makedirs
 import posixpath
 
-import pandas as pd
+if TYPE_CHECKING:
+    import pandas as pd
 
-BUCKET_EXTRACT_NAME = environ.get("BUCKET_EXTRACT_NAME")
+# Formats for EXPORT_FORMAT, which may list several separated by commas.
+# Parquet and Feather need pyarrow, which is not in the Pipfile, so they are
+# only accepted where it has been installed separately.
+EXPORT_FORMATS = ["csv", "parquet", "feather"]
+COLUMNAR_FORMATS = ["parquet", "feather"]
 
+DATE_COLUMNS = ["date_of_birth", "date_of_proceeding", "date_of_publication"]
+CATEGORICAL_COLUMNS = ["court", "federal_state", "format", "kind", "type_of_proceeding"]
 
-def export_cases(cases: List[Dict], original_filename: str):
-    logger.info("Exporting {} cases for {}", len(cases), original_filename)
 
-    if not cases:
+def export_formats() -> List[str]:
+    formats = [
+        name.strip().lower()
+        for name in environ.get("EXPORT_FORMAT", "csv").split(",")
+        if name.strip()
+    ]
+
+    unknown = [name for name in formats if name not in EXPORT_FORMATS]
+    if unknown:
+        raise ValueError(
+            f"Unknown EXPORT_FORMAT {', '.join(unknown)}, "
+            f"use one or more of {', '.join(EXPORT_FORMATS)}"
+        )
+
+    # Fail before anything is exported instead of after the CSV was written
+    columnar = [name for name in formats if name in COLUMNAR_FORMATS]
+    if columnar and find_spec("pyarrow") is None:
+        raise ValueError(
+            f"EXPORT_FORMAT {', '.join(columnar)} needs pyarrow, which is not "
+            "installed, use csv or install pyarrow"
+        )
+
+    return formats
+
+
+def export_cases(cases: Union[List[Dict], Dict[str, List]], original_filename: str):
+    """
+    Exports extracted cases, either as a list of features per case or as the
+    feature columns returned by extract_features_batch
+    """
+    columns = isinstance(cases, dict)
+    count = len(next(iter(cases.values()), [])) if columns else len(cases)
+    logger.info("Exporting {} cases for {}", count, original_filename)
+
+    if not count:
         logger.warning("No cases, skipping")
         return
 
-    df = pd.DataFrame.from_records(data=cases)
+    # Imported here so the S3 trigger doesn't load pandas before it's needed
+    import pandas as pd
+
+    if columns:
+        df = pd.DataFrame(cases)
+    else:
+        df = pd.DataFrame.from_records(data=cases)
+
+    for export_format in export_formats():
+        if export_format == "csv":
+            export_csv(df, original_filename)
+        else:
+            export_columnar(df, original_filename, export_format)
 
+
+def export_csv(df: "pd.DataFrame", original_filename: str):
     if environ.get("USE_LOCAL_FILES"):
         export_filename = path.join("extracted", original_filename + ".csv")
         export_path = path.join(*path.split(export_filename)[:-1])
@@ -31,10 +87,75 @@ def export_cases(cases: List[Dict], original_filename: str):
         upload_dataframe(
             df,
             export_filename,
-            bucket=BUCKET_EXTRACT_NAME,
+            bucket=bucket_name("BUCKET_EXTRACT_NAME"),
             index=False,
+            compare=False,
             archive=False,
             public_read=False,
+            gzip=True,
         )
 
     logger.success("Exporting {} finished!", export_filename)
+
+
+def typed_frame(df: "pd.DataFrame") -> "pd.DataFrame":
+    """
+    Returns the extracted cases with dates as datetimes and repetitive text
+    columns as categoricals
+    """
+    import pandas as pd
+
+    df = df.copy()
+
+    for column in DATE_COLUMNS:
+        if column in df:
+            df[column] = pd.to_datetime(df[column], errors="coerce")
+
+    for column in CATEGORICAL_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype("category")
+
+    return df
+
+
+def partition_key(export_format: str, month: str, original_filename: str) -> str:
+    """
+    Returns the key of a partition below the extract bucket or ``extracted/``.
+    Partitions are named like Hive partitions, one directory per month of
+    publication with one file per source file.
+    """
+    name = posixpath.basename(original_filename.replace(path.sep, "/"))
+    return f"{export_format}/month={month}/{name}.{export_format}"
+
+
+def export_columnar(df: "pd.DataFrame", original_filename: str, export_format: str):
+    df = typed_frame(df)
+    months = df["date_of_publication"].dt.strftime("%Y-%m").fillna("unknown")
+
+    for month, df_month in df.groupby(months, sort=True):
+        bio = BytesIO()
+        df_month = df_month.reset_index(drop=True)
+
+        if export_format == "parquet":
+            df_month.to_parquet(bio, index=False)
+        else:
+            df_month.to_feather(bio)
+
+        key = partition_key(export_format, month, original_filename)
+
+        if environ.get("USE_LOCAL_FILES"):
+            export_filename = path.join("extracted", *key.split("/"))
+            makedirs(path.dirname(export_filename), exist_ok=True)
+            with open(export_filename, "wb") as fp:
+                fp.write(bio.getbuffer())
+        else:
+            export_filename = key
+            get_client().put_object(
+                Bucket=bucket_name("BUCKET_EXTRACT_NAME"),
+                Key=key,
+                Body=bio.getvalue(),
+                ACL="private",
+                ContentType="application/octet-stream",
+            )
+
+        logger.success("Exporting {} finished!", export_filename)
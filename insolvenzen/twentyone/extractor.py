@@ -1,8 +1,8 @@
 import re
 import datetime as dt
+from functools import lru_cache
 import hashlib
-
-import dateparser
+from typing import Dict, Iterable, List, Optional
 
 from insolvenzen.utils.types import JSON
 
@@ -18,6 +18,59 @@ RE_PROCEEDING_DATE = re.compile(
     r"(\d{2}\.\d{2}\.\d{4})$",
 )
 
+# Used by extract_features_batch: the date of birth and ZIP code patterns in
+# one, and the date of proceeding matched against the end of the description
+RE_DOB_OR_ZIPCODE = re.compile(
+    rf"(?P<dob>{RE_DOB.pattern})|(?P<zipcode>{RE_ZIPCODE.pattern})",
+    flags=re.IGNORECASE,
+)
+RE_DATE = re.compile(r"\d{2}\.\d{2}\.\d{4}")
+RE_NOT_ALPHANUMERIC = re.compile(r"[^a-zA-Z0-9]+")
+
+
+@lru_cache(maxsize=None)
+def german_date_parser():
+    """
+    Returns a date parser for German dates.
+
+    dateparser is slow to import and to load its locale data, so both happen on
+    first use and the parser is reused for all cases.
+    """
+    from dateparser.date import DateDataParser
+
+    return DateDataParser(locales=["de"])
+
+
+def parse_date(date_string: str):
+    """
+    Same as ``dateparser.parse(date_string, locales=["de"])``
+    """
+    data = german_date_parser().get_date_data(date_string)
+
+    if data:
+        return data["date_obj"]
+
+
+@lru_cache(maxsize=4096)
+def _parse_date_cached(date_string: str):
+    return parse_date(date_string)
+
+
+def parse_german_date(date_string: str) -> Optional[dt.datetime]:
+    """
+    Same as :func:`parse_date` for dates matched as ``DD.MM.YYYY``, which are
+    converted directly. Invalid dates like 31.02.2021 are left to dateparser.
+    """
+    if date_string.isascii():
+        try:
+            return dt.datetime(
+                int(date_string[6:]), int(date_string[3:5]), int(date_string[:2])
+            )
+        except ValueError:
+            pass
+
+    return _parse_date_cached(date_string)
+
 
 def normalize_description(description: str):
     description = description.lower()
@@ -41,7 +94,7 @@ def extract_features(case: JSON) -> dict:
     # Feature: Date of birth
     match = re.search(RE_DOB, case["description"])
     try:
-        dob = match and dateparser.parse(match.group(1), locales=["de"]).date()
+        dob = match and parse_date(match.group(1)).date()
     except AttributeError:
         dob = None
 
@@ -55,7 +108,7 @@ def extract_features(case: JSON) -> dict:
 
     # Feature: Date of proceeding
     match = re.search(RE_PROCEEDING_DATE, case["description"])
-    proceeding_date = match and dateparser.parse(match.group(0), locales=["de"])
+    proceeding_date = match and parse_date(match.group(0))
 
     # Feature: Type of proceeding
     if format == "alt":
@@ -98,3 +151,99 @@ def extract_features(case: JSON) -> dict:
         pass
 
     return dict(sorted(features.items()))
+
+
+def extract_features_batch(cases: Iterable[JSON]) -> Dict[str, List]:
+    """
+    Extracts the features of many cases at once, with the same results as
+    calling :func:`extract_features` for each of them.
+
+    Returns the features as columns, ordered like the columns of a DataFrame
+    built from the results of extract_features. Cases without a field have
+    None in its column. Like extract_features, this changes the cases.
+    """
+    columns: Dict[str, List] = {}
+    count = 0
+
+    for case in cases:
+        for key, value in _extract_features_fast(case):
+            column = columns.get(key)
+            if column is None:
+                column = columns[key] = [None] * count
+            column.append(value)
+
+        count += 1
+        for column in columns.values():
+            if len(column) < count:
+                column.append(None)
+
+    return columns
+
+
+def _extract_features_fast(case: JSON):
+    """
+    Returns the sorted ``(name, value)`` pairs of extract_features
+    """
+    description = case.pop("description")
+    format = case.get("format", "alt")
+
+    # Feature: ZIP code and date of birth, the first match of each
+    zipcode = None
+    dob = None
+    for match in RE_DOB_OR_ZIPCODE.finditer(description):
+        if match.lastgroup == "zipcode":
+            if zipcode is None:
+                zipcode = match.group("zipcode")
+        elif dob is None:
+            dob = parse_german_date(match.group(2))
+            dob = dob and dob.date()
+            # Keep looking for a ZIP code, but not for a valid date of birth
+            dob = dob or False
+
+        if zipcode is not None and dob is not None:
+            break
+
+    # Feature: Kind (IK or IN)
+    case_nr = case["case_nr"].lower()
+    if "ik" in case_nr:
+        kind = "ik"
+    elif "in" in case_nr:
+        kind = "in"
+    else:
+        kind = None
+
+    # Feature: Date of proceeding, which ends the description if present
+    tail = description[-11:-1] if description.endswith("\n") else description[-10:]
+    proceeding_date = RE_DATE.fullmatch(tail) and parse_german_date(tail)
+
+    # Feature: Type of proceeding
+    if format == "alt":
+        match = RE_PROCEEDING_TYPE.search(case["file_name"])
+        proceeding_type = match and match.group(0)
+        del case["url"]
+    elif format == "neu":
+        proceeding_type = case.pop("kind").replace(" ", "_")
+    else:
+        raise ValueError(f"Unknown format {format}")
+
+    # Feature: Hash of description
+    normalized = description.lower()
+    if normalized.startswith("öffentliche bekanntmachung"):
+        normalized = normalized[len("öffentliche bekanntmachung") :]
+    normalized = RE_NOT_ALPHANUMERIC.sub("", normalized.strip())
+    description_hash = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    case["date_of_publication"] = case.pop("date")
+    case.pop("_type", None)
+
+    features = {
+        "zipcode": zipcode,
+        "date_of_birth": dob or None,
+        "kind": kind,
+        "type_of_proceeding": proceeding_type,
+        "date_of_proceeding": proceeding_date,
+        "description_hash": description_hash,
+    }
+    features.update(case)
+
+    return sorted(features.items())
@@ -1,10 +1,9 @@
 from glob import glob
-from io import TextIOWrapper
 from os import path, environ
 from typing import Generator, List
 
 from jsonlines.jsonlines import Reader
-from insolvenzen.utils.storage import download_file
+from insolvenzen.utils.s3 import bucket_name, get_client
 
 import jsonlines
 
@@ -12,6 +11,10 @@ from insolvenzen.utils.types import JSON
 
 JSONL_PATH = "insolvenzbekanntmachungen-scraper"
 
+# Bytes read from the S3 response at a time. Lines are parsed as they arrive,
+# so only the current chunk and the line being read are held in memory.
+READ_CHUNK_SIZE = 64 * 1024
+
 
 def list_files() -> List[str]:
     if environ.get("USE_LOCAL_FILES"):
@@ -37,12 +40,19 @@ def list_files() -> List[str]:
 def get_cases(filename: str) -> Generator[JSON, None, None]:
 
     if environ.get("USE_LOCAL_FILES"):
-        reader = jsonlines.open(filename, "r")
-    else:
-        bio = download_file(filename, bucket=environ["BUCKET_SOURCE_NAME_TWENTYONE"])
-        tio = TextIOWrapper(bio, encoding="utf-8")
-        reader = Reader(tio)
-        reader._should_close_fp = True
-
-    with reader:
-        yield from reader.iter()
+        with jsonlines.open(filename, "r") as reader:
+            yield from reader.iter()
+        return
+
+    # Stream the object instead of downloading it first, so memory doesn't
+    # grow with the size of the file
+    response = get_client().get_object(
+        Bucket=bucket_name("BUCKET_SOURCE_NAME_TWENTYONE"), Key=filename
+    )
+    body = response["Body"]
+
+    try:
+        with Reader(body.iter_lines(chunk_size=READ_CHUNK_SIZE)) as reader:
+            yield from reader.iter()
+    finally:
+        body.close()
@@ -0,0 +1,266 @@
+"""
+Persistent store of extracted cases, deduplicated by description hash.
+
+The scraper snapshots overlap heavily, so the same announcement is extracted
+from many files. handle_file adds every file to a SQLite database with one row
+per description hash, and the analysis reads the deduplicated cases from it
+instead of grouping all extracted CSVs again.
+
+Each case keeps, per field, the first non-empty value in the order of source
+file and position, like ``groupby("description_hash").first()`` over the
+extracted files in sorted order. Files can be added in any order and adding
+a file twice has no effect.
+"""
+
+import datetime as dt
+import json
+from os import environ, makedirs, path
+import sqlite3
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+# Rows per SELECT, below SQLite's limit of variables per statement
+QUERY_CHUNK_SIZE = 500
+
+# Seconds to wait for other processes writing to the store
+LOCK_TIMEOUT = 120
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cases (
+    description_hash TEXT PRIMARY KEY,
+    first_file TEXT NOT NULL,
+    first_position INTEGER NOT NULL,
+    seen INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    sources TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cases_first_seen ON cases (first_file, first_position);
+CREATE TABLE IF NOT EXISTS files (
+    filename TEXT PRIMARY KEY,
+    cases INTEGER NOT NULL,
+    new_cases INTEGER NOT NULL,
+    added TEXT NOT NULL
+);
+"""
+
+# (file, position) of the row a value was taken from
+Key = Tuple[str, int]
+
+
+def store_path() -> Optional[str]:
+    """
+    Returns the path of the store, which is ``CASE_STORE_PATH`` or next to
+    the extracted files in local mode. Without it, no store is kept.
+    """
+    if environ.get("CASE_STORE_PATH"):
+        return environ["CASE_STORE_PATH"]
+
+    if environ.get("USE_LOCAL_FILES"):
+        return path.join("extracted", "cases.sqlite")
+
+    return None
+
+
+def serialize_value(value) -> Optional[str]:
+    """
+    Converts a feature to the text written to the extracted CSVs, with
+    empty values as None
+    """
+    if value is None or value == "":
+        return None
+
+    if isinstance(value, dt.datetime):
+        if value.time() == dt.time():
+            return value.strftime("%Y-%m-%d")
+        return str(value)
+
+    if isinstance(value, dt.date):
+        return value.isoformat()
+
+    return str(value)
+
+
+class CaseStore:
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+        directory = path.dirname(file_path)
+        if directory:
+            makedirs(directory, exist_ok=True)
+
+        self.connection = sqlite3.connect(
+            file_path, timeout=LOCK_TIMEOUT, isolation_level=None
+        )
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def add(self, filename: str, columns: Dict[str, List]) -> int:
+        """
+        Adds the feature columns extracted from ``filename`` and returns the
+        number of cases that were not in the store yet
+        """
+        names = list(columns)
+        count = len(columns[names[0]]) if names else 0
+
+        # Lock the store for writing, so concurrent processes don't lose merges
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            if self.connection.execute(
+                "SELECT 1 FROM files WHERE filename = ?", (filename,)
+            ).fetchone():
+                self.connection.execute("ROLLBACK")
+                logger.info("{} is already in the case store", filename)
+                return 0
+
+            hashes = columns["description_hash"] if count else []
+            cases = self._load(set(hashes))
+            new_cases = 0
+
+            for position in range(count):
+                values = {
+                    name: serialize_value(columns[name][position]) for name in names
+                }
+                description_hash = values["description_hash"]
+                key = (filename, position)
+
+                case = cases.get(description_hash)
+                if case is None:
+                    new_cases += 1
+                    case = cases[description_hash] = {
+                        "first": key,
+                        "seen": 0,
+                        "data": {},
+                        "sources": {},
+                    }
+
+                _merge(case, key, values)
+
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO cases VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        description_hash,
+                        case["first"][0],
+                        case["first"][1],
+                        case["seen"],
+                        json.dumps(case["data"], ensure_ascii=False),
+                        json.dumps(case["sources"], ensure_ascii=False),
+                    )
+                    for description_hash, case in cases.items()
+                ),
+            )
+            self.connection.execute(
+                "INSERT INTO files VALUES (?, ?, ?, ?)",
+                (filename, count, new_cases, dt.datetime.utcnow().isoformat()),
+            )
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+        return new_cases
+
+    def _load(self, hashes: set) -> Dict[str, dict]:
+        hashes = list(hashes)
+        cases = {}
+
+        for start in range(0, len(hashes), QUERY_CHUNK_SIZE):
+            chunk = hashes[start : start + QUERY_CHUNK_SIZE]
+            rows = self.connection.execute(
+                "SELECT description_hash, first_file, first_position, seen, data, "
+                f"sources FROM cases WHERE description_hash IN "
+                f"({', '.join('?' * len(chunk))})",
+                chunk,
+            )
+            for description_hash, file, position, seen, data, sources in rows:
+                cases[description_hash] = {
+                    "first": (file, position),
+                    "seen": seen,
+                    "data": json.loads(data),
+                    "sources": {
+                        name: tuple(key) for name, key in json.loads(sources).items()
+                    },
+                }
+
+        return cases
+
+    def cases(
+        self, filters: Optional[Dict[str, Iterable[str]]] = None
+    ) -> Iterator[dict]:
+        """
+        Generates the deduplicated cases in first-seen order, with the number
+        of times they were seen as ``seen``, optionally only those whose
+        fields have one of the values in ``filters``
+        """
+        conditions = []
+        parameters = []
+        for name, values in (filters or {}).items():
+            values = list(values)
+            conditions.append(
+                f"json_extract(data, ?) IN ({', '.join('?' * len(values))})"
+            )
+            parameters.extend([f"$.{name}", *values])
+
+        rows = self.connection.execute(
+            "SELECT seen, data FROM cases "
+            + (f"WHERE {' AND '.join(conditions)} " if conditions else "")
+            + "ORDER BY first_file, first_position",
+            parameters,
+        )
+        for seen, data in rows:
+            case = json.loads(data)
+            case["seen"] = seen
+            yield case
+
+    def files(self) -> List[str]:
+        return [
+            filename
+            for filename, in self.connection.execute(
+                "SELECT filename FROM files ORDER BY filename"
+            )
+        ]
+
+
+def _merge(case: dict, key: Key, values: Dict[str, Optional[str]]):
+    """
+    Merges a row into a case, keeping the value of each field that comes
+    first by ``(file, position)``
+    """
+    first = case["first"]
+    data = case["data"]
+    sources = {name: case["sources"].get(name, first) for name in data}
+
+    for name, value in values.items():
+        if value is not None and (name not in data or key < sources[name]):
+            data[name] = value
+            sources[name] = key
+
+    case["first"] = first = min(first, key)
+    case["seen"] += 1
+    # Sources are only kept for values that don't come from the first row
+    case["sources"] = {
+        name: source for name, source in sources.items() if source != first
+    }
+
+
+def add_to_store(filename: str, columns: Dict[str, List]):
+    """
+    Adds extracted features to the store, if one is kept
+    """
+    file_path = store_path()
+    if file_path is None:
+        return
+
+    with CaseStore(file_path) as store:
+        new_cases = store.add(filename, columns)
+
+    logger.info("Added {} new cases from {} to the case store", new_cases, filename)
@@ -0,0 +1,109 @@
+import json
+import os
+from os import path
+from threading import Lock
+from typing import Optional
+
+from loguru import logger
+
+# Serializes manifest writes of all instances sharing a cache directory
+_save_lock = Lock()
+
+
+class SourceCache:
+    """
+    Local on-disk copy of source files, keyed by their S3 key.
+
+    A manifest records size and ETag of every cached file so unchanged files
+    can be served from disk instead of being downloaded again. Instances may be
+    shared between threads.
+    """
+
+    MANIFEST_NAME = "manifest.json"
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self.manifest_path = path.join(cache_dir, self.MANIFEST_NAME)
+        self.manifest = self._read_manifest()
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def _read_manifest(self) -> dict:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as fp:
+                return json.load(fp)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning("Discarding unreadable source cache manifest: {}", e)
+
+        return {}
+
+    def _file_path(self, key: str) -> str:
+        return path.join(self.cache_dir, *key.split("/"))
+
+    def get(self, key: str, size: int, etag: str) -> Optional[bytes]:
+        """
+        Return the cached content for ``key`` if it matches ``size`` and ``etag``.
+        """
+        data = self._read(key, size, etag)
+
+        with self.lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return data
+
+    def _read(self, key: str, size: int, etag: str) -> Optional[bytes]:
+        with self.lock:
+            entry = self.manifest.get(key)
+
+        if entry is None or entry["size"] != size or entry["etag"] != etag:
+            return None
+
+        try:
+            with open(self._file_path(key), "rb") as fp:
+                data = fp.read()
+        except OSError:
+            return None
+
+        if len(data) != size:
+            return None
+
+        return data
+
+    def put(self, key: str, size: int, etag: str, data: bytes):
+        file_path = self._file_path(key)
+        os.makedirs(path.dirname(file_path), exist_ok=True)
+
+        with open(file_path, "wb") as fp:
+            fp.write(data)
+
+        with self.lock:
+            self.manifest[key] = {"size": size, "etag": etag}
+            self.dirty = True
+
+    def save(self):
+        """
+        Write the manifest back to disk if anything changed, keeping entries
+        other instances have saved in the meantime.
+        """
+        with _save_lock, self.lock:
+            if not self.dirty:
+                return
+
+            manifest = self._read_manifest()
+            manifest.update(self.manifest)
+            self.manifest = manifest
+
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = self.manifest_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as fp:
+                json.dump(self.manifest, fp)
+            os.replace(tmp_path, self.manifest_path)
+
+            self.dirty = False
@@ -0,0 +1,283 @@
+"""
+Performance metrics of scrapers and their stages.
+
+A :class:`Collector` gathers one record per scraper or dataset. Code running
+inside a record marks its stages with :func:`stage`. S3 requests sent while a
+stage is active are counted towards it, including requests sent from worker
+threads that were submitted with :func:`submit`.
+
+Wall and CPU time of a stage exclude nested stages. CPU time is the time of the
+whole process and peak memory the peak of the whole process so far, so both
+overlap for scrapers running at the same time.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+import json
+import os
+import resource
+import sys
+from threading import Lock
+import time
+import tracemalloc
+from typing import Dict, Optional, Tuple
+
+from loguru import logger
+
+# Trace Python allocations to report their peak. This slows down the run.
+TRACEMALLOC = bool(os.environ.get("METRICS_TRACEMALLOC"))
+
+STAGES = ["list", "download", "filter", "aggregate", "publish"]
+
+# ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+class Stage:
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_rss = 0
+        self.peak_traced = 0
+        self.s3_requests = 0
+        self.s3_bytes_in = 0
+        self.s3_bytes_out = 0
+
+    def as_dict(self) -> dict:
+        result = {
+            "calls": self.calls,
+            "wall_s": round(self.wall, 3),
+            "cpu_s": round(self.cpu, 3),
+            "peak_rss_mb": round(self.peak_rss / 2**20, 1),
+            "s3_requests": self.s3_requests,
+            "s3_bytes_in": self.s3_bytes_in,
+            "s3_bytes_out": self.s3_bytes_out,
+        }
+        if TRACEMALLOC:
+            result["peak_traced_mb"] = round(self.peak_traced / 2**20, 1)
+
+        return result
+
+
+class Record:
+    """
+    Metrics of one scraper or dataset, in total and per stage
+    """
+
+    def __init__(self):
+        self.total = Stage()
+        self.stages: Dict[str, Stage] = {}
+        self.lock = Lock()
+
+    def stage(self, name: str) -> Stage:
+        with self.lock:
+            return self.stages.setdefault(name, Stage())
+
+    def count_request(self, stage: Optional[Stage], bytes_out: int):
+        with self.lock:
+            for target in (self.total, stage):
+                if target is not None:
+                    target.s3_requests += 1
+                    target.s3_bytes_out += bytes_out
+
+    def count_response(self, stage: Optional[Stage], bytes_in: int):
+        with self.lock:
+            for target in (self.total, stage):
+                if target is not None:
+                    target.s3_bytes_in += bytes_in
+
+    def as_dict(self) -> dict:
+        result = self.total.as_dict()
+        result["stages"] = {
+            name: self.stages[name].as_dict()
+            for name in sorted(self.stages, key=_stage_order)
+        }
+        return result
+
+
+class _Timer:
+    def __init__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+
+        # Time spent in nested stages, which is subtracted from this one
+        self.nested_wall = 0.0
+        self.nested_cpu = 0.0
+
+    def stop(self, target: Stage) -> Tuple[float, float]:
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+
+        target.calls += 1
+        target.wall += wall - self.nested_wall
+        target.cpu += cpu - self.nested_cpu
+        target.peak_rss = max(target.peak_rss, _peak_rss())
+        if TRACEMALLOC:
+            target.peak_traced = max(
+                target.peak_traced, tracemalloc.get_traced_memory()[1]
+            )
+
+        return wall, cpu
+
+
+_record: ContextVar[Optional[Record]] = ContextVar("metrics_record", default=None)
+
+# Names and timers of the active stages, innermost last
+_stages: ContextVar[tuple] = ContextVar("metrics_stages", default=())
+
+
+class Collector:
+    """
+    Collects the records of one run.
+
+    Usage:
+
+        collector = Collector()
+        with collector.record("scrapers", "write_data_private"):
+            with stage("aggregate"):
+                ...
+        collector.emit()
+    """
+
+    def __init__(self):
+        self.records: Dict[str, Dict[str, Record]] = {}
+        self.lock = Lock()
+
+        if TRACEMALLOC and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def record(self, kind: str, name: str):
+        record = Record()
+        with self.lock:
+            self.records.setdefault(kind, {})[name] = record
+
+        record_token = _record.set(record)
+        stages_token = _stages.set(())
+        timer = _Timer()
+        try:
+            yield record
+        finally:
+            timer.stop(record.total)
+            _stages.reset(stages_token)
+            _record.reset(record_token)
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            return {
+                kind: {name: record.as_dict() for name, record in records.items()}
+                for kind, records in self.records.items()
+            }
+
+    def emit(self):
+        """
+        Logs all metrics as a single JSON line
+        """
+        logger.info("{}", json.dumps({"metrics": self.as_dict()}))
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Marks a stage of the current record. Does nothing outside of a record.
+    """
+    record = _record.get()
+    if record is None:
+        yield
+        return
+
+    timer = _Timer()
+    token = _stages.set(_stages.get() + ((name, timer),))
+    try:
+        yield
+    finally:
+        _stages.reset(token)
+        wall, cpu = timer.stop(record.stage(name))
+
+        # Exclude this stage from the one it is nested in
+        stages = _stages.get()
+        if stages:
+            _, outer = stages[-1]
+            outer.nested_wall += wall
+            outer.nested_cpu += cpu
+
+
+def submit(executor, fn, *args, **kwargs):
+    """
+    Same as ``executor.submit``, but the worker runs in the submitting context,
+    so S3 requests it sends are counted towards the current stage
+    """
+    return executor.submit(copy_context().run, fn, *args, **kwargs)
+
+
+def register_s3_hooks(client):
+    """
+    Counts requests and transferred bytes of an S3 client towards the
+    current stage
+    """
+    client.meta.events.register("before-send.s3", _count_request)
+    client.meta.events.register("after-call.s3", _count_response)
+
+
+def _current() -> Tuple[Optional[Record], Optional[Stage]]:
+    record = _record.get()
+    stages = _stages.get()
+
+    if record is None or not stages:
+        return record, None
+
+    name, _ = stages[-1]
+    return record, record.stage(name)
+
+
+def _count_request(request, **kwargs):
+    record, stage = _current()
+    if record is not None:
+        record.count_request(stage, _body_size(request))
+
+
+def _count_response(parsed, **kwargs):
+    record, stage = _current()
+    if record is not None:
+        headers = parsed.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+        record.count_response(stage, _content_length(headers, "content-length"))
+
+
+def _body_size(request) -> int:
+    # Streamed uploads are sent in chunks and only report the decoded length
+    for header in ("X-Amz-Decoded-Content-Length", "Content-Length"):
+        if header in request.headers:
+            return _content_length(request.headers, header)
+
+    body = request.body
+
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    if isinstance(body, str):
+        return len(body.encode("utf-8"))
+
+    try:
+        position = body.tell()
+        end = body.seek(0, os.SEEK_END)
+        body.seek(position)
+        return end - position
+    except (AttributeError, OSError):
+        return 0
+
+
+def _content_length(headers, header: str) -> int:
+    try:
+        return int(headers.get(header) or 0)
+    except ValueError:
+        return 0
+
+
+def _peak_rss() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * RSS_UNIT
+
+
+def _stage_order(name: str):
+    return (STAGES.index(name) if name in STAGES else len(STAGES), name)
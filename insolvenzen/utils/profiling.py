@@ -0,0 +1,150 @@
+"""
+Opt-in profiling of scrapers and twentyone files.
+
+Set ``PROFILE=cprofile`` to record a cProfile of every profiled call, or
+``PROFILE=sample`` to sample its stack every ``PROFILE_INTERVAL`` seconds. Only
+the thread making the call is profiled.
+
+Profiles are written to ``PROFILE_DIR`` if set, otherwise they are uploaded to
+the extract bucket below ``profiles/``. cProfile results can be read with
+``python -m pstats <file>``, sampled stacks are in the collapsed format used by
+flame graph tools.
+"""
+
+from contextlib import contextmanager
+import datetime as dt
+import marshal
+import os
+from os import path
+import re
+import sys
+import threading
+from collections import Counter
+
+from loguru import logger
+
+from insolvenzen.utils.s3 import bucket_name, get_client
+
+PROFILE = os.environ.get("PROFILE", "").lower()
+PROFILE_DIR = os.environ.get("PROFILE_DIR")
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", "0.005"))
+
+PROFILE_PREFIX = "profiles"
+
+
+@contextmanager
+def profile(name: str):
+    """
+    Profiles the code in the block if profiling is enabled, and saves the
+    result named by ``name`` and the current time
+    """
+    if PROFILE == "cprofile":
+        profiler = _start_cprofile()
+    elif PROFILE == "sample":
+        profiler = Sampler(threading.get_ident(), PROFILE_INTERVAL)
+        profiler.start()
+    else:
+        if PROFILE:
+            logger.warning("Unknown PROFILE value {}, not profiling", PROFILE)
+        profiler = None
+
+    if profiler is None:
+        yield
+        return
+
+    try:
+        yield
+    finally:
+        profiler.disable()
+
+        if PROFILE == "cprofile":
+            profiler.create_stats()
+            save(name, "prof", marshal.dumps(profiler.stats))
+        else:
+            save(name, "txt", profiler.collapsed().encode("utf-8"))
+
+
+def _start_cprofile():
+    import cProfile
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        # Only one profiler can be active at a time since Python 3.12
+        logger.warning("Could not start profiler: {}", e)
+        return None
+
+    return profiler
+
+
+class Sampler:
+    """
+    Samples the stack of a thread from a background thread
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def disable(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({path.basename(code.co_filename)}:"
+                    f"{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+        )
+
+
+def save(name: str, extension: str, data: bytes):
+    """
+    Writes a profile to PROFILE_DIR or uploads it to the extract bucket.
+    Failures are logged, so profiling never breaks the profiled code.
+    """
+    timestamp = dt.datetime.utcnow().strftime("%Y-%m-%dT%H-%M-%S-%f")
+    name = re.sub(r"[^\w.-]+", "_", name).strip("_")
+    filename = f"{name}-{timestamp}.{extension}"
+
+    try:
+        if PROFILE_DIR:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            file_path = path.join(PROFILE_DIR, filename)
+            with open(file_path, "wb") as fp:
+                fp.write(data)
+        else:
+            file_path = f"{PROFILE_PREFIX}/{filename}"
+            get_client().put_object(
+                Bucket=bucket_name("BUCKET_EXTRACT_NAME"),
+                Key=file_path,
+                Body=data,
+                ACL="private",
+            )
+    except Exception as e:
+        logger.exception("Saving profile {} failed with {}", filename, e)
+        return
+
+    logger.info("Saved profile to {}", file_path)
@@ -0,0 +1,80 @@
+import os
+from threading import Lock
+
+# Requests a single thread pool sends in parallel, used by source downloads and
+# by uploads in storage
+MAX_WORKERS = 16
+
+# Downloads and uploads may run at the same time and share one client
+MAX_POOL_CONNECTIONS = 2 * MAX_WORKERS
+
+# Attempts per request, including the first one. Adaptive mode backs off and
+# rate limits the client when S3 throttles with SlowDown or 503 responses.
+MAX_ATTEMPTS = 10
+
+_client = None
+_client_lock = Lock()
+
+
+class MissingBucketError(Exception):
+    pass
+
+
+def get_client():
+    """
+    Returns the shared S3 client, creating it on first use.
+
+    boto3 is imported here as well, so modules that only touch S3 in some
+    code paths don't pay for it when they are imported.
+    """
+    global _client
+
+    with _client_lock:
+        if _client is None:
+            from boto3 import client
+            from botocore.config import Config
+
+            from insolvenzen.utils.metrics import register_s3_hooks
+
+            # S3_ENDPOINT_URL points the client to an S3-compatible stand-in,
+            # which is usually only reachable with path-style addressing
+            endpoint_url = os.environ.get("S3_ENDPOINT_URL") or None
+
+            _client = client(
+                "s3",
+                endpoint_url=endpoint_url,
+                config=Config(
+                    max_pool_connections=MAX_POOL_CONNECTIONS,
+                    retries={"mode": "adaptive", "total_max_attempts": MAX_ATTEMPTS},
+                    s3={"addressing_style": "path"} if endpoint_url else None,
+                ),
+            )
+            register_s3_hooks(_client)
+
+        return _client
+
+
+def bucket_name(env_var: str) -> str:
+    """
+    Returns the name of the bucket configured in the environment variable
+    ``env_var``
+    """
+    name = os.environ.get(env_var)
+
+    if not name:
+        raise MissingBucketError(
+            f"No bucket configured, please set the {env_var} environment variable."
+        )
+
+    return name
+
+
+def set_client(client):
+    """
+    Replaces the shared client, e.g. with a local stand-in for benchmarks.
+    Passing None creates a new client on next use.
+    """
+    global _client
+
+    with _client_lock:
+        _client = client
@@ -1,12 +1,20 @@
 import json
-from io import BytesIO
 import os
 from os import path
 from enum import Enum
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import datetime as dt
+from itertools import islice
+import tempfile
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
-from boto3 import client
 from loguru import logger
 
+from insolvenzen.utils import metrics
+from insolvenzen.utils.cache import SourceCache
+from insolvenzen.utils.s3 import MAX_WORKERS, bucket_name, get_client
+
 
 class InsolvencyType(Enum):
     PRIVATE = "ik"
@@ -19,41 +27,261 @@ class CaseType(Enum):
     SICHERUNGSMASSNAHMEN = "sicherungsmassnahmen"
 
 
-try:
-    s3 = client("s3")
-    bucket = os.environ["BUCKET_SOURCE_NAME"]
-except Exception as e:
-    logger.info("Warning: s3 client for source not created: {}", e)
-
 USE_LOCAL_FILES = bool(os.environ.get("USE_LOCAL_FILES"))
 
+SOURCE_CACHE_DIR = os.environ.get(
+    "SOURCE_CACHE_DIR",
+    path.join(tempfile.gettempdir(), "insolvenzen-source-cache"),
+)
+
+NRW = "Nordrhein-Westfalen"
+
+
+class SourceObject(NamedTuple):
+    filename: str
+    size: int
+    # S3 ETag, or the modification time for local files
+    etag: str
+
+
+class ProjectedCase(NamedTuple):
+    # Only required for cases in NRW, None if missing elsewhere
+    aktenzeichen: Optional[str]
+    court: Optional[str]
+    is_company: bool
+    has_residences: bool
+    # Raw kreis-name of the first residence in NRW, None if not in NRW
+    district: Optional[str]
+
+
+def project_case(obj: dict) -> ProjectedCase:
+    """
+    Shrinks a case whose residences have been projected already
+    """
+    residences = obj.get("courtcase-residences", [])
+    district = next(
+        (kreis_name for state_name, kreis_name in residences if state_name == NRW),
+        None,
+    )
+
+    if district is None:
+        aktenzeichen = obj.get("courtcase-aktenzeichen")
+        court = obj.get("courtcase-court")
+    else:
+        aktenzeichen = obj["courtcase-aktenzeichen"]
+        court = obj["courtcase-court"]
+
+    return ProjectedCase(
+        aktenzeichen,
+        court,
+        bool(obj.get("courtcase-is-company")),
+        bool(residences),
+        district,
+    )
+
+
+def _project(obj: dict):
+    """
+    Object hook that shrinks cases to the few fields the scrapers use while
+    the file is being decoded, so the nested subtrees are dropped right away.
+    """
+    # Not all cases have an aktenzeichen
+    if (
+        "courtcase-aktenzeichen" in obj
+        or "courtcase-court" in obj
+        or "courtcase-residences" in obj
+    ):
+        return project_case(obj)
+
+    if "geolocation-street" in obj:
+        kreis = obj["geolocation-street"]["street-gemeinde"]["gemeinde-kreis"]
+        return (kreis["kreis-bundesland"]["bundesland-name"], kreis["kreis-name"])
+
+    return obj
+
 
-def load_source_file(insolvency_type: InsolvencyType, filename: str):
+def decode_source_file(data: bytes, *, projected: bool = False):
+    """
+    Decode a source file. With ``projected``, cases are returned as
+    :class:`ProjectedCase` tuples instead of the full nested dicts.
+    """
+    if projected:
+        return json.loads(data, object_hook=_project)
+
+    return json.loads(data)
+
+
+def load_source_file(
+    insolvency_type: InsolvencyType,
+    filename: str,
+    *,
+    projected: bool = False,
+):
     if USE_LOCAL_FILES:
         with open(
-            path.join(os.environ["LOCAL_FILES"], insolvency_type.value, filename)
+            path.join(os.environ["LOCAL_FILES"], insolvency_type.value, filename),
+            "rb",
         ) as fp:
-            data = json.load(fp)
+            data = fp.read()
 
-        return data
+        return decode_source_file(data, projected=projected)
 
     filename = f"{insolvency_type.value}/{filename}"
-    bio = BytesIO()
-    s3.download_fileobj(bucket, filename, bio)
-    bio.seek(0)
-    return json.load(bio)
+    response = get_client().get_object(Bucket=source_bucket(), Key=filename)
+    return decode_source_file(response["Body"].read(), projected=projected)
 
 
-def list_files(insolvency_type: InsolvencyType):
+def load_cached_source_file(
+    insolvency_type: InsolvencyType,
+    source_object: SourceObject,
+    cache: SourceCache,
+    *,
+    projected: bool = False,
+):
+    """
+    Load a source file, downloading it only if the cached copy is missing or
+    no longer matches the size and ETag from the listing.
+    """
     if USE_LOCAL_FILES:
-        return sorted(
-            os.listdir(path.join(os.environ["LOCAL_FILES"], insolvency_type.value))
+        return load_source_file(
+            insolvency_type, source_object.filename, projected=projected
         )
 
+    key = f"{insolvency_type.value}/{source_object.filename}"
+    data = cache.get(key, source_object.size, source_object.etag)
+
+    if data is None:
+        response = get_client().get_object(Bucket=source_bucket(), Key=key)
+        data = response["Body"].read()
+
+        # The cache is best-effort, a full disk must not fail the download
+        try:
+            cache.put(key, source_object.size, source_object.etag, data)
+        except OSError as e:
+            logger.warning("Could not cache source file {}: {}", key, e)
+
+    return decode_source_file(data, projected=projected)
+
+
+def load_source_files(
+    insolvency_type: InsolvencyType,
+    source_objects: Iterable[SourceObject],
+    *,
+    cache: Optional[SourceCache] = None,
+    max_workers: int = MAX_WORKERS,
+    projected: bool = False,
+) -> Dict[dt.date, dict]:
+    """
+    Download and decode many source files concurrently.
+
+    Returns a dict mapping the date of each file to its content, ordered by date.
+    """
+    return dict(
+        iter_source_files(
+            insolvency_type,
+            source_objects,
+            cache=cache,
+            max_workers=max_workers,
+            projected=projected,
+        )
+    )
+
+
+def iter_source_files(
+    insolvency_type: InsolvencyType,
+    source_objects: Iterable[SourceObject],
+    *,
+    cache: Optional[SourceCache] = None,
+    max_workers: int = MAX_WORKERS,
+    projected: bool = False,
+) -> Iterator[Tuple[dt.date, dict]]:
+    """
+    Generate ``(date, content)`` for each source file, ordered by date.
+
+    Files are downloaded and decoded concurrently, but at most ``max_workers``
+    of them are fetched ahead of the consumer.
+    """
+    own_cache = cache is None
+    if own_cache:
+        cache = open_source_cache()
+
+    source_objects = iter(sorted(source_objects, key=lambda obj: obj.filename))
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+            def submit(source_object):
+                future = metrics.submit(
+                    executor,
+                    load_cached_source_file,
+                    insolvency_type,
+                    source_object,
+                    cache,
+                    projected=projected,
+                )
+                return source_date(source_object), future
+
+            pending = deque(submit(obj) for obj in islice(source_objects, max_workers))
+
+            while pending:
+                date, future = pending.popleft()
+                data = future.result()
+
+                for source_object in islice(source_objects, 1):
+                    pending.append(submit(source_object))
+
+                yield date, data
+    finally:
+        if own_cache:
+            save_source_cache(cache)
+
+
+def source_bucket() -> str:
+    return bucket_name("BUCKET_SOURCE_NAME")
+
+
+def open_source_cache() -> SourceCache:
+    return SourceCache(SOURCE_CACHE_DIR)
+
+
+def save_source_cache(cache: SourceCache):
+    """
+    Saves the manifest of the source cache, logging instead of failing if it
+    can't be written
+    """
+    try:
+        cache.save()
+    except OSError as e:
+        logger.warning("Could not save source cache manifest: {}", e)
+
+
+def source_date(source_object: SourceObject) -> dt.date:
+    return dt.date.fromisoformat(source_object.filename[:10])
+
+
+def list_files(insolvency_type: InsolvencyType):
+    return [
+        source_object.filename for source_object in list_source_objects(insolvency_type)
+    ]
+
+
+def list_source_objects(insolvency_type: InsolvencyType) -> List[SourceObject]:
+    if USE_LOCAL_FILES:
+        base_dir = path.join(os.environ["LOCAL_FILES"], insolvency_type.value)
+        source_objects = []
+
+        for filename in sorted(os.listdir(base_dir)):
+            stat = os.stat(path.join(base_dir, filename))
+            source_objects.append(
+                SourceObject(filename, stat.st_size, str(stat.st_mtime_ns))
+            )
+
+        return source_objects
+
     prefix = insolvency_type.value + "/"
     return [
-        key.replace(prefix, "")
-        for key in get_matching_s3_keys(prefix=prefix, suffix=".json")
+        SourceObject(obj["Key"].replace(prefix, ""), obj["Size"], obj["ETag"])
+        for obj in get_matching_s3_objects(prefix=prefix, suffix=".json")
     ]
 
 
@@ -68,9 +296,9 @@ def get_matching_s3_objects(prefix="", suffix=""):
     :param suffix: Only fetch objects whose keys end with
         this suffix (optional).
     """
-    paginator = s3.get_paginator("list_objects_v2")
+    paginator = get_client().get_paginator("list_objects_v2")
 
-    kwargs = {"Bucket": bucket}
+    kwargs = {"Bucket": source_bucket()}
 
     # We can pass the prefix directly to the S3 API.  If the user has passed
     # a tuple or list of prefixes, we go through them one by one.
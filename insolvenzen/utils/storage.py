@@ -1,23 +1,40 @@
-import os
-from io import BytesIO
+from io import BytesIO, RawIOBase, TextIOWrapper
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Callable, Literal, Optional, Union
+import gzip as gzip_module
+import hashlib
+import json
+from threading import Lock
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    List,
+    Literal,
+    NamedTuple,
+    Optional,
+    Union,
+)
 import posixpath
 
-import pytz
-import pandas as pd
 from loguru import logger
 
-from botocore.exceptions import ClientError
-from boto3 import client
-import sentry_sdk
+from insolvenzen.utils import metrics
+from insolvenzen.utils.s3 import MAX_WORKERS, bucket_name, get_client
 
-BUCKET_PUBLIC = None
-try:
-    s3 = client("s3")
-    BUCKET_PUBLIC = os.environ["BUCKET_PUBLIC_NAME"]
-except Exception as e:
-    logger.info("Warning: s3 client not created: {}", e)
+# pandas, pytz, botocore and sentry_sdk are imported where they are used to keep
+# imports cheap for callers that only need part of this module
+if TYPE_CHECKING:
+    import pandas as pd
+
+BUCKET_PUBLIC_ENV = "BUCKET_PUBLIC_NAME"
+
+# Object in each bucket that maps uploaded filenames to their content hashes
+MANIFEST_KEY = "manifest.json"
+
+_manifests: Dict[str, dict] = {}
+_dirty_manifests = set()
+_manifests_lock = Lock()
 
 
 def simple_compare(old, new):
@@ -26,6 +43,8 @@ def simple_compare(old, new):
 
 def make_df_compare_fn(*, ignore_columns=None):
     def is_equal(old, new):
+        import pandas as pd
+
         old = pd.read_csv(BytesIO(old))
         new = pd.read_csv(BytesIO(new))
 
@@ -38,88 +57,286 @@ def make_df_compare_fn(*, ignore_columns=None):
     return is_equal
 
 
-def download_file(filename, *, bucket=BUCKET_PUBLIC):
+def content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+class HashingWriter(RawIOBase):
+    """
+    Binary stream that hashes everything written to it before passing it on
+    """
+
+    def __init__(self, target):
+        self.target = target
+        self.hash = hashlib.sha256()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.hash.update(b)
+        return self.target.write(b)
+
+
+def serialize_dataframe(df: "pd.DataFrame", *, index: bool = True, gzip: bool = False):
+    """
+    Streams a DataFrame as CSV into a buffer ready for upload, optionally
+    gzip-compressed.
+
+    Returns the buffer together with the hash of the uncompressed CSV.
+    """
     bio = BytesIO()
-    s3.download_fileobj(bucket, filename, bio)
+    target = gzip_module.GzipFile(fileobj=bio, mode="wb", mtime=0) if gzip else bio
+    writer = HashingWriter(target)
+
+    text = TextIOWrapper(writer, encoding="utf-8", newline="", write_through=True)
+    df.to_csv(text, index=index, line_terminator="\n")
+    text.flush()
+    text.detach()
+
+    if gzip:
+        target.close()
+
     bio.seek(0)
-    return bio
+    return bio, writer.hash.hexdigest()
+
+
+def read_content(bio: BytesIO) -> bytes:
+    """
+    Returns the content of a downloaded file, decompressing gzipped files
+    """
+    content = bio.read()
+    if content[:2] == b"\x1f\x8b":
+        content = gzip_module.decompress(content)
+    return content
+
+
+def get_manifest(bucket: str) -> dict:
+    """
+    Returns the hash manifest of the bucket, downloading it on first use
+    """
+    from botocore.exceptions import ClientError
+
+    with _manifests_lock:
+        if bucket not in _manifests:
+            try:
+                response = get_client().get_object(Bucket=bucket, Key=MANIFEST_KEY)
+                _manifests[bucket] = json.loads(response["Body"].read())
+            except ClientError as e:
+                logger.warning("No manifest loaded for {}: {}", bucket, e)
+                _manifests[bucket] = {}
+
+        return _manifests[bucket]
+
+
+def update_manifest(bucket: str, filename: str, digest: str):
+    manifest = get_manifest(bucket)
+
+    with _manifests_lock:
+        if manifest.get(filename) != digest:
+            manifest[filename] = digest
+            _dirty_manifests.add(bucket)
+
+
+def save_manifests():
+    """
+    Writes back all changed manifests. Manifests are downloaded again on next use.
+    """
+    with _manifests_lock:
+        for bucket in _dirty_manifests:
+            logger.debug("Saving manifest for {}...", bucket)
+            get_client().put_object(
+                Bucket=bucket,
+                Key=MANIFEST_KEY,
+                Body=json.dumps(_manifests[bucket], indent=2, sort_keys=True).encode(
+                    "utf-8"
+                ),
+                ACL="private",
+                ContentType="application/json",
+            )
+
+        _dirty_manifests.clear()
+        _manifests.clear()
+
+
+def download_file(filename, *, bucket: Optional[str] = None):
+    bucket = bucket or bucket_name(BUCKET_PUBLIC_ENV)
+    response = get_client().get_object(Bucket=bucket, Key=filename)
+    return BytesIO(response["Body"].read())
 
 
 def upload_dataframe(
-    df: pd.DataFrame,
+    df: "pd.DataFrame",
     filename: str,
     *,
     index: bool = True,
     change_notification: Optional[str] = None,
     compare: Optional[Union[Callable, Literal[False]]] = None,
-    bucket: str = BUCKET_PUBLIC,
+    bucket: Optional[str] = None,
     archive: bool = True,
-    public_read: True,
+    public_read: bool = True,
+    gzip: bool = False,
 ):
+    from botocore.exceptions import ClientError
+
     logger.info("Uploading dataframe...")
-    if compare is None:
-        compare = simple_compare
+    s3 = get_client()
+    bucket = bucket or bucket_name(BUCKET_PUBLIC_ENV)
 
-    # Convert to csv and encode to get bytes
-    write = df.to_csv(
-        index=index,
-        line_terminator="\n",
-        encoding="utf-8",
-    ).encode("utf-8")
+    # Stream csv into the upload buffer
+    bio_new, digest = serialize_dataframe(df, index=index, gzip=gzip)
 
     # Read old file-like object to check for differences
     compare_failed = False
 
-    if compare is not False:
+    if compare is None:
+        logger.debug("Comparing hashes...")
+        old_digest = get_manifest(bucket).get(filename)
+
+        # Files missing from the manifest are compared with the stored version once
+        if old_digest is None:
+            try:
+                old_digest = content_hash(
+                    read_content(download_file(filename, bucket=bucket))
+                )
+            except ClientError:
+                logger.warning("Compare failed!")
+                compare_failed = True
+
+        if old_digest == digest:
+            update_manifest(bucket, filename, digest)
+            logger.success("No need to update file, done.")
+            return
+
+    elif compare is not False:
         logger.debug("Comparing...")
-        bio_old = BytesIO()
 
         try:
-            s3.download_fileobj(bucket, filename, bio_old)
+            old = read_content(download_file(filename, bucket=bucket))
         except ClientError:
             logger.warning("Compare failed!")
             compare_failed = True
 
-        bio_old.seek(0)
-        if not compare_failed and compare(bio_old.read(), write):
+        if not compare_failed and compare(old, read_content(bio_new)):
             logger.success("No need to update file, done.")
             return
 
+        bio_new.seek(0)
+
     # Notify
     if change_notification and not compare_failed:
+        import sentry_sdk
+
         logger.debug("Send notification via Sentry...")
         sentry_sdk.capture_message(change_notification)
 
-    # Create new file-like object for upload
-    bio_new = BytesIO(write)
-
     # Upload file with ACL and content type
     logger.debug("Uploading file...")
-    s3.upload_fileobj(
-        bio_new,
-        bucket,
-        filename,
-        ExtraArgs={
-            "ACL": "public-read" if public_read else "private",
-            "ContentType": "text/plain; charset=utf-8",
-        },
-    )
+    extra_args = {
+        "ACL": "public-read" if public_read else "private",
+        "ContentType": "text/plain; charset=utf-8",
+    }
+    if gzip:
+        extra_args["ContentEncoding"] = "gzip"
+
+    s3.put_object(Bucket=bucket, Key=filename, Body=bio_new, **extra_args)
+
+    # Only hash-compared files are tracked, so callers that don't compare
+    # neither download nor have to save the manifest
+    if compare is None:
+        update_manifest(bucket, filename, digest)
 
     if not archive:
         return
 
-    # Upload file again into timestamped folder
-    logger.debug("Uploading archive version of file...")
-    bio_new = BytesIO(write)
+    # Copy the uploaded file into timestamped folder
+    logger.debug("Copying archive version of file...")
+    s3.copy_object(
+        CopySource={"Bucket": bucket, "Key": filename},
+        Bucket=bucket,
+        Key=archive_filename(filename),
+        ACL="public-read" if public_read else "private",
+        MetadataDirective="COPY",
+    )
+
+
+def archive_filename(filename: str) -> str:
+    """
+    Returns the key of the archive copy of a file, e.g. ``2021-11-01/file.csv``
+    """
+    import pytz
+
     now = datetime.now(tz=pytz.timezone("Europe/Berlin"))
     timestamp = now.date().isoformat()
     *path, filename = posixpath.split(filename)
-    s3.upload_fileobj(
-        bio_new,
-        bucket,
-        f"{posixpath.join(*path)}/{timestamp}/{filename}".lstrip("/"),
-        ExtraArgs={
-            "ACL": "public-read" if public_read else "private",
-            "ContentType": "text/plain; charset=utf-8",
-        },
-    )
+    return f"{posixpath.join(*path)}/{timestamp}/{filename}".lstrip("/")
+
+
+class PublishResult(NamedTuple):
+    filename: str
+    error: Optional[Exception] = None
+
+
+class PublishError(Exception):
+    def __init__(self, results: List[PublishResult]):
+        self.results = results
+        failed = [result.filename for result in results if result.error is not None]
+        super().__init__(f"Publishing failed for {', '.join(failed)}")
+
+
+class PublishQueue:
+    """
+    Collects DataFrames and uploads them concurrently with ``upload_dataframe``.
+
+    Usage:
+
+        queue = PublishQueue()
+        queue.submit(df, "filename.csv")
+        queue.publish()
+    """
+
+    def __init__(self, *, max_workers: int = MAX_WORKERS):
+        self.max_workers = max_workers
+        self.jobs = []
+
+    def submit(self, df: "pd.DataFrame", filename: str, **kwargs):
+        """
+        Queues a DataFrame for upload. Keyword arguments are passed on to
+        ``upload_dataframe``.
+        """
+        self.jobs.append((df, filename, kwargs))
+
+    def publish(self) -> List[PublishResult]:
+        """
+        Uploads all queued DataFrames and returns one result per file.
+
+        Raises a ``PublishError`` after all uploads have finished if any of them
+        failed.
+        """
+        jobs, self.jobs = self.jobs, []
+
+        with metrics.stage("publish"), ThreadPoolExecutor(
+            max_workers=self.max_workers
+        ) as executor:
+            futures = [
+                (
+                    filename,
+                    metrics.submit(executor, upload_dataframe, df, filename, **kwargs),
+                )
+                for df, filename, kwargs in jobs
+            ]
+
+        results = []
+        for filename, future in futures:
+            error = future.exception()
+            if error is not None:
+                logger.opt(exception=error).error("Publishing {} failed", filename)
+
+            results.append(PublishResult(filename, error))
+
+        errors = [result.error for result in results if result.error is not None]
+        if errors:
+            raise PublishError(results) from errors[0]
+
+        logger.success("Published {} files", len(results))
+        return results